@@ -0,0 +1,86 @@
+"""Build images for several Houdini versions at once."""
+
+# Standard Library
+import argparse
+import contextlib
+import os
+import pathlib
+
+# hython_docker_image_builder
+from hython_docker_image_builder import builder, history, mirror, orchestrator
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the program argument parser.
+
+    Returns:
+        An argument parser.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("tag")
+    parser.add_argument("client_id")
+    parser.add_argument("client_secret")
+    parser.add_argument("versions", nargs="+", help="The versions to build, e.g. 20.5 21.0 21.0.512")
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--push", action="store_true", help="Push the images instead of loading them locally")
+    parser.add_argument("--max-jobs", type=int, help="The most builds to run at once. Defaults to one per 4 CPUs")
+    parser.add_argument(
+        "--disk-per-build",
+        type=float,
+        default=orchestrator.DEFAULT_DISK_PER_BUILD / 1024**3,
+        help="The free disk space, in GiB, each build needs",
+    )
+    parser.add_argument("--log-dir", type=pathlib.Path, default=pathlib.Path("build_logs"))
+    parser.add_argument(
+        "--mirror-url",
+        default=os.environ.get(mirror.MIRROR_URL_ENV_VAR),
+        help=f"An installer mirror to try downloading from first. Defaults to ${mirror.MIRROR_URL_ENV_VAR}",
+    )
+    parser.add_argument("--mirror-store", type=pathlib.Path, help="A mirror store directory to add downloads to")
+    parser.add_argument(
+        "--history",
+        type=pathlib.Path,
+        default=history.get_default_path(),
+        help=f"A build history database to consult and record to. Defaults to ${history.HISTORY_ENV_VAR}",
+    )
+
+    return parser
+
+
+def main() -> None:
+    """Execute the main program."""
+    parser = build_parser()
+
+    args = parser.parse_args()
+
+    build_history = history.BuildHistory(args.history) if args.history is not None else None
+
+    with contextlib.closing(build_history) if build_history is not None else contextlib.nullcontext():
+        service = builder.get_service(args.client_id, args.client_secret)
+
+        builds = [
+            builder.check_build_can_be_installed(
+                service,
+                version,
+                args.tag,
+                force=args.force,
+                mirror_url=args.mirror_url,
+                mirror_store=args.mirror_store,
+                build_history=build_history,
+            )
+            for version in args.versions
+        ]
+
+        orchestrator.run_builds(
+            builds,
+            args.tag,
+            args.log_dir,
+            max_jobs=args.max_jobs,
+            disk_per_build=int(args.disk_per_build * 1024**3),
+            push=args.push,
+            build_history=build_history,
+        )
+
+
+if __name__ == "__main__":
+    main()
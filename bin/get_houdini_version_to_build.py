@@ -2,11 +2,21 @@
 
 # Standard Library
 import argparse
+import contextlib
+import functools
 import os
 import pathlib
+import subprocess
 
 # hython_docker_image_builder
-from hython_docker_image_builder import builder
+from hython_docker_image_builder import (
+    builder,
+    docker,
+    history,
+    mirror,
+    profiling,
+    watcher,
+)
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -21,10 +31,69 @@ def build_parser() -> argparse.ArgumentParser:
     parser.add_argument("client_id")
     parser.add_argument("client_secret")
     parser.add_argument("--force", action="store_true")
+    parser.add_argument("--watch", action="store_true", help="Keep running and report new production builds")
+    parser.add_argument("--hook", help="An executable to run with the full version of each new build when watching")
+    parser.add_argument(
+        "--mirror-url",
+        default=os.environ.get(mirror.MIRROR_URL_ENV_VAR),
+        help=f"An installer mirror to try downloading from first. Defaults to ${mirror.MIRROR_URL_ENV_VAR}",
+    )
+    parser.add_argument("--mirror-store", type=pathlib.Path, help="A mirror store directory to add downloads to")
+    parser.add_argument("--stream-releases", action="store_true", help="Filter the releases listing as it is received")
+    parser.add_argument(
+        "--profile",
+        action=argparse.BooleanOptionalAction,
+        default=profiling.is_enabled_by_env(),
+        help=f"Record the time and memory used by each stage. Defaults to ${profiling.PROFILE_ENV_VAR}",
+    )
+    parser.add_argument(
+        "--history",
+        type=pathlib.Path,
+        default=history.get_default_path(),
+        help=f"A build history database to consult and record to. Defaults to ${history.HISTORY_ENV_VAR}",
+    )
 
     return parser
 
 
+def handle_new_release(release: dict, tag_base: str, hook: str | None) -> None:
+    """Report a newly found release.
+
+    Args:
+        release: The release information dictionary.
+        tag_base: The dockerhub user/repo name.
+        hook: An optional executable to run with the full version and tag base.
+
+    Raises:
+        subprocess.CalledProcessError: If the hook failed.
+    """
+    full_version = f"{release['version']}.{release['build']}"
+
+    print(f"New build available: {full_version}", flush=True)
+
+    if hook is not None:
+        subprocess.run([hook, full_version, tag_base], check=True)
+
+
+def is_release_known(release: dict, tag_base: str, build_history: history.BuildHistory | None) -> bool:
+    """Check whether a release has already been built and pushed.
+
+    Args:
+        release: The release information dictionary.
+        tag_base: The dockerhub user/repo name.
+        build_history: The build history to consult before checking the registry, if any.
+
+    Returns:
+        Whether the release's image has been pushed.
+    """
+    full_version = f"{release['version']}.{release['build']}"
+
+    if build_history is not None and build_history.find_pushed(tag_base, full_version) is not None:
+        return True
+
+    return docker.check_tag_exists(tag_base, full_version)
+
+
 def main() -> None:
     """Execute the main program."""
     parser = build_parser()
@@ -36,9 +105,34 @@ def main() -> None:
     client_secret = args.client_secret
     force = args.force
 
-    service = builder.get_service(client_id, client_secret)
+    build_history = history.BuildHistory(args.history) if args.history is not None else None
+
+    if args.watch:
+        with contextlib.closing(build_history) if build_history is not None else contextlib.nullcontext():
+            watcher.watch_releases(
+                functools.partial(builder.get_service, client_id, client_secret),
+                version,
+                functools.partial(handle_new_release, tag_base=tag_base, hook=args.hook),
+                is_known=functools.partial(is_release_known, tag_base=tag_base, build_history=build_history),
+            )
+        return
+
+    with (
+        profiling.profile() if args.profile else contextlib.nullcontext(),
+        contextlib.closing(build_history) if build_history is not None else contextlib.nullcontext(),
+    ):
+        service = builder.get_service(client_id, client_secret)
 
-    result = builder.check_build_can_be_installed(service, version, tag_base, force=force)
+        result = builder.check_build_can_be_installed(
+            service,
+            version,
+            tag_base,
+            force=force,
+            mirror_url=args.mirror_url,
+            mirror_store=args.mirror_store,
+            stream_releases=args.stream_releases,
+            build_history=build_history,
+        )
 
     if result:
         output_path = pathlib.Path(os.environ["GITHUB_OUTPUT"])
@@ -0,0 +1,45 @@
+"""Point an alias tag at an existing image directly in the registry."""
+
+# Standard Library
+import argparse
+import os
+
+# hython_docker_image_builder
+from hython_docker_image_builder import docker
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the program argument parser.
+
+    Returns:
+        An argument parser.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("tag")
+    parser.add_argument("version", help="The existing image version, e.g. 21.0.512")
+    parser.add_argument("alias", help="The version to point at the existing image, e.g. 21.0")
+    parser.add_argument("--target-tag", help="Copy the image to this user/repo instead")
+    parser.add_argument("--registry", default=docker.REGISTRY_URL)
+
+    return parser
+
+
+def main() -> None:
+    """Execute the main program."""
+    parser = build_parser()
+
+    args = parser.parse_args()
+
+    client = docker.RegistryClient(
+        args.registry,
+        username=os.environ.get("DOCKERHUB_USERNAME"),
+        password=os.environ.get("DOCKERHUB_TOKEN"),
+    )
+
+    digest = docker.promote_tag(client, args.tag, args.version, args.alias, args.target_tag)
+
+    print(f"Promoted image digest: {digest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""Serve verified installers to other machines on the local network."""
+
+# Standard Library
+import argparse
+import pathlib
+
+# hython_docker_image_builder
+from hython_docker_image_builder import mirror
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the program argument parser.
+
+    Returns:
+        An argument parser.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("store", type=pathlib.Path, help="The mirror store directory to serve")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+
+    return parser
+
+
+def main() -> None:
+    """Execute the main program."""
+    parser = build_parser()
+
+    args = parser.parse_args()
+
+    mirror.serve(args.store, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Show the historical timings and throughput of each build stage."""
+
+# Standard Library
+import argparse
+import contextlib
+import pathlib
+
+# hython_docker_image_builder
+from hython_docker_image_builder import history
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the program argument parser.
+
+    Returns:
+        An argument parser.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "history",
+        type=pathlib.Path,
+        nargs="?",
+        default=history.get_default_path(),
+        help=f"The build history database. Defaults to ${history.HISTORY_ENV_VAR}",
+    )
+    parser.add_argument("--version", help="Also list the recorded events for this full version, e.g. 21.0.512")
+
+    return parser
+
+
+def main() -> None:
+    """Execute the main program."""
+    parser = build_parser()
+
+    args = parser.parse_args()
+
+    if args.history is None:
+        parser.error("No build history database was given")
+
+    with contextlib.closing(history.BuildHistory(args.history)) as build_history:
+        for stats in build_history.get_stage_statistics():
+            name = f"{stats['stage']} {stats['product']}" if stats["product"] else stats["stage"]
+            throughput = (
+                f", {stats['bytes_per_second'] / 1024**2:.1f} MiB/s" if stats["bytes_per_second"] is not None else ""
+            )
+
+            print(
+                f"{name}: {stats['count']} runs, mean {stats['mean_duration']:.1f}s, "
+                f"max {stats['max_duration']:.1f}s{throughput}"
+            )
+
+        if args.version:
+            for event in build_history.get_events(args.version):
+                details = ", ".join(
+                    f"{key}={event[key]}" for key in ("tag_base", "product", "hash", "size", "digest") if event[key]
+                )
+                print(f"{event['recorded_at']} {event['stage']} {details}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,18 +4,25 @@
 from __future__ import annotations
 
 # Standard Library
+import contextlib
+import fcntl
 import hashlib
+import heapq
+import itertools
+import os
 import pathlib
-import shutil
-from http import HTTPStatus
-from operator import itemgetter
+import time
+from typing import TYPE_CHECKING
 
 # Third Party
 import requests
 
 # hython_docker_image_builder
 import sidefx
-from hython_docker_image_builder import docker
+from hython_docker_image_builder import docker, download, history, mirror, profiling
+
+if TYPE_CHECKING:
+    from collections.abc import Generator, Iterable, Iterator
 
 # Globals
 TOKEN_URL = "https://www.sidefx.com/oauth2/application_token"
@@ -27,61 +34,104 @@ SUPPORTED_MAJOR_MINOR_VERSIONS = (
     "22.0",
 )
 
-# Non-Public Functions
+# How long to wait for another process to finish downloading the same file.
+DOWNLOAD_LOCK_TIMEOUT = 2 * 60 * 60
 
+_LOCK_POLL_INTERVAL = 0.1
 
-def _determine_version_info(version_arg: str) -> tuple[str | None, str | None]:
-    """Determine the target version information.
+# A mirror is only a shortcut, so give up on it quickly rather than delay falling back to SideFX.
+MIRROR_DOWNLOAD_ATTEMPTS = 2
+
+# Non-Public Functions
 
-    `version_arg` can be empty, a {major.minor} or {major.minor.build} type string.
+
+def _download_from_mirror(mirror_url: str, expected_hash: str, target: pathlib.Path) -> bool:
+    """Try to download a verified file from a mirror.
 
     Args:
-        version_arg: A version string to use in determining which version to install.
+        mirror_url: The base url of the mirror.
+        expected_hash: The md5 hash of the file to download.
+        target: The path to save the file as.
 
     Returns:
-        The target {major.minor} version and build number, if any
+        Whether the file was downloaded and verified.
     """
-    if version_arg:
-        components = version_arg.split(".")
+    try:
+        download.download_file(
+            f"{mirror_url.rstrip('/')}/{expected_hash}", target, max_attempts=MIRROR_DOWNLOAD_ATTEMPTS
+        )
+        _verify_checksum(target, expected_hash)
 
-        if len(components) < 2:  # ruff:ignore[magic-value-comparison]
-            raise RuntimeError(f"Invalid version argument: {version_arg} must have at least 2 components")
+    except (requests.RequestException, RuntimeError) as inst:
+        print(f"Could not download from mirror, falling back to SideFX: {inst}")
 
-        major_minor = ".".join(components[:2])
-        build = ".".join(components[2:]) if len(components) > 2 else None  # ruff:ignore[magic-value-comparison]
+        # Don't let the SideFX download resume from whatever the mirror sent.
+        target.unlink(missing_ok=True)
+        return False
 
-    else:
-        major_minor = None
-        build = None
+    return True
 
-    return major_minor, build
 
+@contextlib.contextmanager
+def _download_lock(target: pathlib.Path, timeout: float = DOWNLOAD_LOCK_TIMEOUT) -> Generator[None]:
+    """Hold an exclusive lock on downloading a file, waiting while any other process holds it.
 
-def _download_file(url: str, target: pathlib.Path) -> None:
-    """Save the url to the target file.
+    The lock is a flock() on a lock file next to the target, so it is released by the
+    kernel if the holder crashes. Any partial downloads found once the lock is acquired
+    can therefore only have been left behind by a crashed process, and are removed.
 
     Args:
-        url: The url to download.
-        target: The path to save the file as.
+        target: The file which will be downloaded.
+        timeout: How long to wait for the lock, in seconds.
 
     Raises:
-        RuntimeError: If the url could not be grabbed.
+        RuntimeError: If the lock could not be acquired in time.
     """
-    r = requests.get(url, stream=True)
+    lock_path = target.with_name(f".{target.name}.lock")
+    deadline = time.monotonic() + timeout
+    waiting = False
+
+    with lock_path.open("a+", encoding="utf-8") as handle:
+        while True:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
 
-    if r.status_code == HTTPStatus.OK:
-        with target.open("wb") as f:
-            r.raw.decode_content = True
-            shutil.copyfileobj(r.raw, f)
-    else:
-        raise RuntimeError(f"Error downloading file. Returned code {r.status_code}")
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise RuntimeError(f"Timed out waiting for another process to download {target.name}") from None
+
+                if not waiting:
+                    handle.seek(0)
+                    print(f"Waiting for process {handle.read().strip() or '?'} to finish downloading {target.name}")
+                    waiting = True
 
+                time.sleep(_LOCK_POLL_INTERVAL)
 
-def _determine_release(releases: list[dict], build: str | None) -> dict:
+        try:
+            handle.seek(0)
+            previous_pid = handle.read().strip() or "?"
+
+            for partial in target.parent.glob(f".{target.name}.*.part"):
+                print(f"Removing partial download {partial.name} left by crashed process {previous_pid}")
+                partial.unlink(missing_ok=True)
+
+            handle.seek(0)
+            handle.truncate()
+            handle.write(str(os.getpid()))
+            handle.flush()
+
+            yield
+
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _determine_release(releases: Iterable[dict], build: str | None) -> dict:
     """Determine which of the available releases to install.
 
     Args:
-        releases: A list of available releases.
+        releases: The available releases.
         build: The target build to install, if any.
 
     Returns:
@@ -102,16 +152,115 @@ def _determine_release(releases: list[dict], build: str | None) -> dict:
             raise RuntimeError(f"Build {release['version']}.{build} not found!")
 
     else:
-        # Sort the releases by date to actually get the latest production build.
+        # Find the release with the latest date to actually get the latest production build.
         # Without doing this, a new build of an older version (e.g., 19.5) would
         # not be found if any build of a newer version (e.g., 20.0) existed.
-        releases.sort(key=itemgetter("date"))
-
-        release_to_install = releases[-1]
+        release_to_install = _get_newest_releases(releases, 1)[0]
 
     return release_to_install
 
 
+def _download_verified(product_info: dict, target: pathlib.Path, mirror_url: str | None, product: str) -> None:
+    """Download a product and verify it before moving it into place.
+
+    The product is downloaded to a temporary file which is only renamed to the target
+    once verified, so the target is never seen partially written.
+
+    Args:
+        product_info: The download information returned by the SideFX Web API.
+        target: The path to save the file as.
+        mirror_url: The base url of an installer mirror to try downloading from first.
+        product: The product name, used to name the profiling stage.
+    """
+    partial = target.with_name(f".{target.name}.{os.getpid()}.part")
+
+    try:
+        if mirror_url is None or not _download_from_mirror(mirror_url, product_info["hash"], partial):
+            download.download_file(product_info["download_url"], partial)
+
+            # Verify the file checksum is matching
+            with profiling.stage(f"checksum {product}"):
+                _verify_checksum(partial, product_info["hash"])
+
+        partial.replace(target)
+
+    finally:
+        partial.unlink(missing_ok=True)
+
+
+def _filter_releases(releases: Iterable[dict], major_minor: str | None, *, only_production: bool) -> Iterator[dict]:
+    """Lazily filter releases by version and whether they are production builds.
+
+    Releases without a 'release' type are assumed to be production builds since the
+    API has already been asked to only return those.
+
+    Args:
+        releases: The releases to filter.
+        major_minor: The {major.minor} version to keep, if any.
+        only_production: Whether to only keep production builds.
+
+    Yields:
+        The matching releases.
+    """
+    for release in releases:
+        if major_minor is not None and release["version"] != major_minor:
+            continue
+
+        if only_production and release.get("release", "gold") != "gold":
+            continue
+
+        yield release
+
+
+def _get_newest_releases(releases: Iterable[dict], count: int) -> list[dict]:
+    """Get the newest releases by date, holding only `count` releases in memory at once.
+
+    Where releases share a date, later ones in the listing are considered newer.
+
+    Args:
+        releases: The releases to search.
+        count: The number of releases to get.
+
+    Returns:
+        The newest releases, newest first.
+    """
+    newest = heapq.nlargest(count, enumerate(releases), key=lambda item: (item[1]["date"], item[0]))
+
+    return [release for _, release in newest]
+
+
+def _is_downloaded(target: pathlib.Path, expected_hash: str, build_history: history.BuildHistory | None = None) -> bool:
+    """Check whether a file has already been downloaded and verified.
+
+    Files the build history shows were verified, and haven't changed since, are not
+    hashed again.
+
+    Args:
+        target: The downloaded file path.
+        expected_hash: The expected md5 hash.
+        build_history: The build history to consult and update.
+
+    Returns:
+        Whether the file exists and matches the expected hash.
+    """
+    if not target.is_file():
+        return False
+
+    if build_history is not None and build_history.is_verified_file(target, expected_hash):
+        return True
+
+    try:
+        _verify_checksum(target, expected_hash)
+
+    except RuntimeError:
+        return False
+
+    if build_history is not None:
+        build_history.add_verified_file(target, expected_hash)
+
+    return True
+
+
 def _verify_checksum(file_path: pathlib.Path, expected_hash: str) -> None:
     """Verify the file hash matches the expected value.
 
@@ -132,14 +281,31 @@ def _verify_checksum(file_path: pathlib.Path, expected_hash: str) -> None:
 # Functions
 
 
-def check_build_can_be_installed(service: sidefx._Service, version_arg: str, tag_base: str, *, force: bool) -> dict:
+def check_build_can_be_installed(  # ruff:ignore[too-many-arguments]
+    service: sidefx._Service,
+    version_arg: str,
+    tag_base: str,
+    *,
+    force: bool,
+    mirror_url: str | None = None,
+    mirror_store: pathlib.Path | None = None,
+    stream_releases: bool = False,
+    build_history: history.BuildHistory | None = None,
+) -> dict:
     """Check whether a build can be installed.
 
+    If a build history is passed, builds it shows were already pushed are skipped
+    without checking the registry, and what is resolved and downloaded is recorded.
+
     Args:
         service: The SideFX Web API connection.
         version_arg: A version string to use in determining which version to install.
         tag_base: The dockerhub user/repo name.
         force: Whether to force building if the target tag already exists.
+        mirror_url: The base url of an installer mirror to try downloading from first.
+        mirror_store: A mirror store directory to add the downloaded installers to.
+        stream_releases: Whether to stream the releases listing.
+        build_history: The build history to consult and record to.
 
     Returns:
         A dictionary containing information about the build to be installed.
@@ -147,7 +313,12 @@ def check_build_can_be_installed(service: sidefx._Service, version_arg: str, tag
     Raises:
         RuntimeError: Raised if the requested {major.minor} version is not supported.
     """
-    target_release = get_target_release(service, version_arg)
+    start = time.perf_counter()
+
+    with profiling.stage("listing"):
+        target_release = get_target_release(service, version_arg, stream=stream_releases)
+
+    listing_duration = time.perf_counter() - start
 
     version = target_release["version"]
 
@@ -165,11 +336,28 @@ def check_build_can_be_installed(service: sidefx._Service, version_arg: str, tag
     # Create the 'full' version here since the passed in version could be something like
     # "20.0" and the resolved actual version is provided by the returned value.
     full_version = f"{version}.{target_release['build']}"
+    tag_name = docker.build_full_tag_name(tag_base, full_version)
+
+    pushed = None
+
+    if build_history is not None:
+        build_history.record(history.RESOLVED, full_version, duration=listing_duration)
 
-    tag_exists = docker.check_tag_exists(tag_base, full_version)
+        pushed = build_history.find_pushed(tag_base, full_version)
+
+        if pushed is not None and not force:
+            print(f"{tag_name} was pushed at {pushed['recorded_at']} according to the build history, skipping")
+            return {}
+
+    with profiling.stage("tag check"):
+        tag_exists = docker.check_tag_exists(tag_base, full_version)
+
+    if tag_exists and build_history is not None and pushed is None:
+        # Remember the tag exists so later runs don't need to check.
+        build_history.record(history.PUSHED, full_version, tag_base=tag_base)
 
     if tag_exists and not force:
-        print(f"{docker.build_full_tag_name(tag_base, full_version)} already exists, skipping")
+        print(f"{tag_name} already exists, skipping")
         return {}
 
     # The folder the actual build files are/will be placed under. This is the major.minor portion
@@ -179,8 +367,24 @@ def check_build_can_be_installed(service: sidefx._Service, version_arg: str, tag
     if not build_folder.is_dir():
         raise RuntimeError(f"Cannot find dockerfiles for {version}")
 
-    launcher = download_product(service, target_release, "houdini-launcher", build_folder)
-    archive = download_product(service, target_release, "launcher-iso", build_folder)
+    launcher = download_product(
+        service,
+        target_release,
+        "houdini-launcher",
+        build_folder,
+        mirror_url=mirror_url,
+        mirror_store=mirror_store,
+        build_history=build_history,
+    )
+    archive = download_product(
+        service,
+        target_release,
+        "launcher-iso",
+        build_folder,
+        mirror_url=mirror_url,
+        mirror_store=mirror_store,
+        build_history=build_history,
+    )
 
     return {
         "version": version,
@@ -190,35 +394,96 @@ def check_build_can_be_installed(service: sidefx._Service, version_arg: str, tag
     }
 
 
-def download_product(
-    service: sidefx._Service, release: dict, product: str, target_folder: pathlib.Path
+def determine_version_info(version_arg: str) -> tuple[str | None, str | None]:
+    """Determine the target version information.
+
+    `version_arg` can be empty, a {major.minor} or {major.minor.build} type string.
+
+    Args:
+        version_arg: A version string to use in determining which version to install.
+
+    Returns:
+        The target {major.minor} version and build number, if any
+    """
+    if version_arg:
+        components = version_arg.split(".")
+
+        if len(components) < 2:  # ruff:ignore[magic-value-comparison]
+            raise RuntimeError(f"Invalid version argument: {version_arg} must have at least 2 components")
+
+        major_minor = ".".join(components[:2])
+        build = ".".join(components[2:]) if len(components) > 2 else None  # ruff:ignore[magic-value-comparison]
+
+    else:
+        major_minor = None
+        build = None
+
+    return major_minor, build
+
+
+def download_product(  # ruff:ignore[too-many-arguments]
+    service: sidefx._Service,
+    release: dict,
+    product: str,
+    target_folder: pathlib.Path,
+    *,
+    mirror_url: str | None = None,
+    mirror_store: pathlib.Path | None = None,
+    build_history: history.BuildHistory | None = None,
 ) -> pathlib.Path:
     """Download the desired product.
 
+    If a mirror url is passed, the product is downloaded from there when possible
+    rather than from SideFX. If the product has already been downloaded and verified,
+    or another process is currently downloading it, that file is reused instead.
+
     Args:
         service: The SideFX Web API connection.
         release: The build information dictionary.
         product: The product name to download.
         target_folder: The folder to save the downloaded product.
+        mirror_url: The base url of an installer mirror to try downloading from first.
+        mirror_store: A mirror store directory to add the downloaded product to.
+        build_history: The build history to consult and record the download to.
 
     Returns:
         The downloaded file path.
     """
-    product_info = service.download.get_daily_build_download(
-        product=product,
-        version=release["version"],
-        build=release["build"],
-        platform="linux_x86_64",
-    )
-
-    target = target_folder / product_info["filename"]
-
-    _download_file(product_info["download_url"], target)
-
-    print(f"Downloaded file: {target.resolve().as_posix()}")
-
-    # Verify the file checksum is matching
-    _verify_checksum(target, product_info["hash"])
+    with profiling.stage(f"download {product}"):
+        product_info = service.download.get_daily_build_download(
+            product=product,
+            version=release["version"],
+            build=release["build"],
+            platform="linux_x86_64",
+        )
+
+        target = target_folder / product_info["filename"]
+
+        # Only one process downloads a file at a time. Any others wait and then reuse its result.
+        with _download_lock(target):
+            if _is_downloaded(target, product_info["hash"], build_history):
+                print(f"Reusing verified file: {target.resolve().as_posix()}")
+
+            else:
+                start = time.perf_counter()
+                _download_verified(product_info, target, mirror_url, product)
+                duration = time.perf_counter() - start
+
+                print(f"Downloaded file: {target.resolve().as_posix()}")
+
+                if build_history is not None:
+                    build_history.add_verified_file(target, product_info["hash"])
+                    build_history.record(
+                        history.DOWNLOADED,
+                        f"{release['version']}.{release['build']}",
+                        product=product,
+                        file_hash=product_info["hash"],
+                        size=target.stat().st_size,
+                        duration=duration,
+                    )
+
+    if mirror_store is not None:
+        mirror.add_to_store(mirror_store, target, product_info["hash"])
 
     return target
 
@@ -233,15 +498,16 @@ def get_service(client_id: str, client_secret: str) -> sidefx._Service:
     Returns:
         A connection to the SideFX Web API.
     """
-    return sidefx.service(
-        access_token_url=TOKEN_URL,
-        client_id=client_id,
-        client_secret_key=client_secret,
-        endpoint_url=ENDPOINT_URL,
-    )
+    with profiling.stage("auth"):
+        return sidefx.service(
+            access_token_url=TOKEN_URL,
+            client_id=client_id,
+            client_secret_key=client_secret,
+            endpoint_url=ENDPOINT_URL,
+        )
 
 
-def get_target_release(service: sidefx._Service, version_arg: str) -> dict:
+def get_target_release(service: sidefx._Service, version_arg: str, *, stream: bool = False) -> dict:
     """Get the target release to install.
 
     `version_arg` can be empty, a {major.minor} or {major.minor.build} type
@@ -249,9 +515,14 @@ def get_target_release(service: sidefx._Service, version_arg: str) -> dict:
     If it is a {major.minor}, then that is used to find the latest production build of
     that release.
 
+    When streaming, releases are filtered as the listing is parsed instead of after it
+    has been received in full, so memory use does not grow with the size of the listing
+    and a specific build can be chosen as soon as it is seen.
+
     Args:
         service: The SideFX Web API connection.
         version_arg: A version string to use in determining which version to install.
+        stream: Whether to stream the releases listing.
 
     Returns:
         The target release dictionary.
@@ -259,17 +530,31 @@ def get_target_release(service: sidefx._Service, version_arg: str) -> dict:
     Raises:
         RuntimeError: No matching version could be found to install.
     """
-    major_minor, build = _determine_version_info(version_arg)
+    major_minor, build = determine_version_info(version_arg)
 
-    releases_list = service.download.get_daily_builds_list(
-        product="houdini",
-        version=major_minor,
-        platform="linux",
+    query = {
+        "product": "houdini",
+        "version": major_minor,
+        "platform": "linux",
         # If no specific build was set, we'll ask for a matching Production build.
-        only_production=not bool(build),
-    )
+        "only_production": not bool(build),
+    }
+
+    if not stream:
+        releases_list = service.download.get_daily_builds_list(**query)
+
+        if not releases_list:
+            raise RuntimeError(f"No releases matching {major_minor} could be found.")
+
+        return _determine_release(releases_list, build)
+
+    # Close the listing once a release has been chosen, even if it wasn't read in full.
+    with contextlib.closing(service.download.get_daily_builds_list.iter_items(**query)) as items:
+        releases = _filter_releases(items, major_minor, only_production=query["only_production"])
+
+        first_release = next(releases, None)
 
-    if not releases_list:
-        raise RuntimeError(f"No releases matching {major_minor} could be found.")
+        if first_release is None:
+            raise RuntimeError(f"No releases matching {major_minor} could be found.")
 
-    return _determine_release(releases_list, build)
+        return _determine_release(itertools.chain([first_release], releases), build)
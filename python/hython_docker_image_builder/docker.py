@@ -1,7 +1,306 @@
 """Functions related to Docker."""
 
+# Future
+from __future__ import annotations
+
 # Standard Library
+import json
+import re
 import subprocess
+from http import HTTPStatus
+
+# Third Party
+import requests
+
+# hython_docker_image_builder
+from hython_docker_image_builder import download
+
+# Globals
+REGISTRY_URL = "https://registry-1.docker.io"
+
+_INDEX_MEDIA_TYPES = (
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+)
+
+_MANIFEST_MEDIA_TYPES = (
+    *_INDEX_MEDIA_TYPES,
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+)
+
+# Classes
+
+
+class RegistryClient:
+    """A minimal client for the registry HTTP API which can copy images between tags.
+
+    Only manifests are transferred. Any layers are referenced in place, or mounted
+    from the source repository when copying between repositories, so no image data
+    is pulled or pushed.
+
+    Args:
+        registry_url: The registry base url.
+        username: The user to authenticate as, if any.
+        password: The password or access token to authenticate with.
+        connect_timeout: The number of seconds to wait for a connection.
+        read_timeout: The number of seconds to wait for any data to arrive.
+    """
+
+    def __init__(
+        self,
+        registry_url: str = REGISTRY_URL,
+        username: str | None = None,
+        password: str | None = None,
+        *,
+        connect_timeout: float = download.DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = download.DEFAULT_READ_TIMEOUT,
+    ) -> None:
+        self.registry_url = registry_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self._credentials = (username, password) if username is not None and password is not None else None
+        self._session = requests.Session()
+        self._tokens: dict[tuple[str, ...], str] = {}
+
+    # Non-Public Methods
+
+    def _fetch_token(self, challenge: str, scopes: tuple[str, ...]) -> str:
+        """Fetch a bearer token for the requested scopes.
+
+        Args:
+            challenge: The WWW-Authenticate header value sent by the registry.
+            scopes: The repository access scopes required.
+
+        Returns:
+            The bearer token.
+
+        Raises:
+            RuntimeError: If the registry did not send a bearer challenge or a token could not be fetched.
+        """
+        params = _parse_bearer_challenge(challenge)
+
+        if "realm" not in params:
+            raise RuntimeError(f"Unsupported registry authentication challenge: {challenge}")
+
+        response = self._session.get(
+            params["realm"],
+            params={"service": params.get("service", ""), "scope": list(scopes)},
+            auth=self._credentials,
+            timeout=self.timeout,
+        )
+
+        if response.status_code != HTTPStatus.OK:
+            raise RuntimeError(f"Could not authenticate with registry. Returned code {response.status_code}")
+
+        result = response.json()
+
+        return result.get("token") or result["access_token"]
+
+    def _request(  # ruff:ignore[too-many-arguments]
+        self,
+        method: str,
+        repository: str,
+        path: str,
+        scopes: tuple[str, ...],
+        *,
+        headers: dict[str, str] | None = None,
+        params: dict[str, str] | None = None,
+        data: bytes | None = None,
+    ) -> requests.Response:
+        """Make a request against a repository, authenticating if asked to.
+
+        Args:
+            method: The HTTP method.
+            repository: The repository name.
+            path: The path within the repository.
+            scopes: The repository access scopes the request requires.
+            headers: Additional request headers.
+            params: The request query parameters.
+            data: The request body.
+
+        Returns:
+            The response.
+        """
+        url = f"{self.registry_url}/v2/{repository}/{path}"
+        headers = dict(headers or {})
+
+        if scopes in self._tokens:
+            headers["Authorization"] = f"Bearer {self._tokens[scopes]}"
+
+        response = self._session.request(method, url, headers=headers, params=params, data=data, timeout=self.timeout)
+
+        # Authenticate for the required scopes and try again if the registry asks us to.
+        if response.status_code == HTTPStatus.UNAUTHORIZED:
+            self._tokens[scopes] = self._fetch_token(response.headers.get("WWW-Authenticate", ""), scopes)
+            headers["Authorization"] = f"Bearer {self._tokens[scopes]}"
+
+            response = self._session.request(
+                method, url, headers=headers, params=params, data=data, timeout=self.timeout
+            )
+
+        return response
+
+    def _copy_references(self, source_repository: str, target_repository: str, content: bytes) -> None:
+        """Make everything referenced by a manifest available in the target repository.
+
+        Args:
+            source_repository: The repository the manifest is from.
+            target_repository: The repository the manifest is being copied to.
+            content: The manifest content.
+        """
+        manifest = json.loads(content)
+
+        # Indexes (multi-platform images) reference other manifests which must be copied first.
+        for child in manifest.get("manifests", []):
+            self.copy_manifest(source_repository, child["digest"], target_repository, child["digest"])
+
+        blobs = [manifest["config"], *manifest.get("layers", [])] if "config" in manifest else []
+
+        for blob in blobs:
+            self.mount_blob(target_repository, blob["digest"], source_repository)
+
+    # Methods
+
+    def blob_exists(self, repository: str, digest: str) -> bool:
+        """Check whether a blob exists in a repository.
+
+        Args:
+            repository: The repository name.
+            digest: The blob digest.
+
+        Returns:
+            Whether the blob exists.
+        """
+        response = self._request("HEAD", repository, f"blobs/{digest}", (f"repository:{repository}:pull",))
+
+        return response.status_code == HTTPStatus.OK
+
+    def copy_manifest(
+        self, source_repository: str, source_reference: str, target_repository: str, target_reference: str
+    ) -> str:
+        """Copy a manifest, and anything it references, to another tag or repository.
+
+        Args:
+            source_repository: The repository to copy from.
+            source_reference: The tag or digest to copy.
+            target_repository: The repository to copy to.
+            target_reference: The tag or digest to copy to.
+
+        Returns:
+            The digest of the copied manifest.
+        """
+        content, media_type = self.get_manifest(source_repository, source_reference)
+
+        if source_repository != target_repository:
+            self._copy_references(source_repository, target_repository, content)
+
+        return self.put_manifest(target_repository, target_reference, content, media_type)
+
+    def get_manifest(self, repository: str, reference: str) -> tuple[bytes, str]:
+        """Get a manifest exactly as it is stored in the registry.
+
+        Args:
+            repository: The repository name.
+            reference: The tag or digest.
+
+        Returns:
+            The raw manifest content and its media type.
+
+        Raises:
+            RuntimeError: If the manifest could not be fetched.
+        """
+        response = self._request(
+            "GET",
+            repository,
+            f"manifests/{reference}",
+            (f"repository:{repository}:pull",),
+            headers={"Accept": ", ".join(_MANIFEST_MEDIA_TYPES)},
+        )
+
+        if response.status_code != HTTPStatus.OK:
+            raise RuntimeError(f"Could not get manifest {repository}:{reference}. Returned code {response.status_code}")
+
+        return response.content, response.headers["Content-Type"]
+
+    def mount_blob(self, repository: str, digest: str, source_repository: str) -> None:
+        """Make a blob from another repository available without transferring it.
+
+        Args:
+            repository: The repository to mount the blob into.
+            digest: The blob digest.
+            source_repository: The repository containing the blob.
+
+        Raises:
+            RuntimeError: If the blob could not be mounted.
+        """
+        if self.blob_exists(repository, digest):
+            return
+
+        response = self._request(
+            "POST",
+            repository,
+            "blobs/uploads/",
+            (f"repository:{repository}:pull,push", f"repository:{source_repository}:pull"),
+            params={"mount": digest, "from": source_repository},
+        )
+
+        # The registry will start a regular upload (202) if it cannot mount the blob.
+        if response.status_code != HTTPStatus.CREATED:
+            raise RuntimeError(
+                f"Could not mount {digest} from {source_repository}. Returned code {response.status_code}"
+            )
+
+    def put_manifest(self, repository: str, reference: str, content: bytes, media_type: str) -> str:
+        """Store a manifest under a tag or digest.
+
+        Args:
+            repository: The repository name.
+            reference: The tag or digest.
+            content: The raw manifest content.
+            media_type: The manifest media type.
+
+        Returns:
+            The digest of the stored manifest.
+
+        Raises:
+            RuntimeError: If the manifest could not be stored.
+        """
+        response = self._request(
+            "PUT",
+            repository,
+            f"manifests/{reference}",
+            (f"repository:{repository}:pull,push",),
+            headers={"Content-Type": media_type},
+            data=content,
+        )
+
+        if response.status_code != HTTPStatus.CREATED:
+            raise RuntimeError(f"Could not put manifest {repository}:{reference}. Returned code {response.status_code}")
+
+        return response.headers["Docker-Content-Digest"]
+
+
+# Non-Public Functions
+
+
+def _parse_bearer_challenge(challenge: str) -> dict[str, str]:
+    """Parse the parameters of a bearer WWW-Authenticate header.
+
+    Args:
+        challenge: The header value.
+
+    Returns:
+        The challenge parameters, or an empty dictionary if it isn't a bearer challenge.
+    """
+    scheme, _, params = challenge.partition(" ")
+
+    if scheme.lower() != "bearer":
+        return {}
+
+    return dict(re.findall(r'(\w+)="([^"]*)"', params))
+
+
+# Functions
 
 
 def build_full_tag_name(tag_base: str, version: str) -> str:
@@ -38,3 +337,39 @@ def check_tag_exists(tag_base: str, version: str) -> bool:
         return False
 
     return True
+
+
+def get_repository_name(tag_base: str) -> str:
+    """Get the registry repository name for a tag base.
+
+    Official images on dockerhub (those without a user) live under the 'library' user.
+
+    Args:
+        tag_base: The user/repo portion of the tag name.
+
+    Returns:
+        The repository name.
+    """
+    return tag_base if "/" in tag_base else f"library/{tag_base}"
+
+
+def promote_tag(
+    client: RegistryClient, tag_base: str, version: str, alias: str, target_tag_base: str | None = None
+) -> str:
+    """Point an alias tag at an existing image without pulling or pushing any layers.
+
+    Args:
+        client: The registry client to use.
+        tag_base: The user/repo portion of the existing image's tag name.
+        version: The existing image version.
+        alias: The version to additionally tag the image as.
+        target_tag_base: The user/repo to tag the image in, if different from the existing one.
+
+    Returns:
+        The digest of the promoted image manifest.
+    """
+    target_tag_base = target_tag_base or tag_base
+
+    print(f"Tagging {build_full_tag_name(tag_base, version)} as {build_full_tag_name(target_tag_base, alias)}")
+
+    return client.copy_manifest(get_repository_name(tag_base), version, get_repository_name(target_tag_base), alias)
@@ -0,0 +1,372 @@
+"""Functions related to reliably downloading large files.
+
+Downloads are made with connect and read timeouts, are abandoned if their throughput
+drops too low, and are retried with jittered exponential backoff, resuming from where
+they left off when the server supports it. A circuit breaker for each host stops any
+further attempts once that host has failed repeatedly.
+"""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import random
+import threading
+import time
+import urllib.parse
+from http import HTTPStatus
+from typing import TYPE_CHECKING
+
+# Third Party
+import requests
+import urllib3
+
+# hython_docker_image_builder
+import sidefx
+
+if TYPE_CHECKING:
+    import pathlib
+    from collections.abc import Callable
+
+# Globals
+# Each chunk is briefly held a few times over while being read, so keep them modest.
+CHUNK_SIZE = 256 * 1024
+
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 60.0
+
+# A download slower than this, averaged over the stall window, is considered stalled.
+DEFAULT_MIN_THROUGHPUT = 64 * 1024
+DEFAULT_STALL_WINDOW = 60.0
+
+DEFAULT_MAX_ATTEMPTS = 6
+DEFAULT_BACKOFF_BASE = 2.0
+DEFAULT_BACKOFF_MAX = 120.0
+
+# The most time, in seconds, a single download may spend across all of its attempts and waits.
+DEFAULT_RETRY_BUDGET = 60.0 * 60
+
+# The number of consecutive downloads from a host which must run out of retries to open its breaker.
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 5.0 * 60
+
+_RETRYABLE_STATUSES = (
+    HTTPStatus.TOO_MANY_REQUESTS,
+    HTTPStatus.INTERNAL_SERVER_ERROR,
+    HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    HTTPStatus.GATEWAY_TIMEOUT,
+)
+
+# Errors caused by the request itself, which retrying won't fix.
+_PERMANENT_ERRORS = (
+    requests.exceptions.InvalidHeader,
+    requests.exceptions.InvalidSchema,
+    requests.exceptions.InvalidURL,
+    requests.exceptions.MissingSchema,
+    requests.exceptions.TooManyRedirects,
+    requests.exceptions.URLRequired,
+    urllib3.exceptions.LocationValueError,
+)
+
+_circuit_breakers: dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+# Non-Public Classes
+
+
+class _RetryableError(Exception):
+    """Raised when a download attempt failed in a way which is worth retrying.
+
+    Args:
+        message: The error message.
+        retry_after: The number of seconds the server asked us to wait, if any.
+    """
+
+    def __init__(self, message: str, retry_after: float | None = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _ThroughputMonitor:
+    """Detect downloads which are still receiving data, but too slowly to be worth continuing.
+
+    Args:
+        min_throughput: The minimum acceptable average bytes per second.
+        window: The number of seconds to average the throughput over.
+        clock: The function used to get the current time.
+    """
+
+    def __init__(self, min_throughput: float, window: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self._min_throughput = min_throughput
+        self._window = window
+        self._clock = clock
+        self._window_start = clock()
+        self._window_bytes = 0
+
+    def update(self, num_bytes: int) -> None:
+        """Record received data.
+
+        Args:
+            num_bytes: The number of bytes received.
+
+        Raises:
+            _RetryableError: If the throughput over the last window was too low.
+        """
+        self._window_bytes += num_bytes
+        elapsed = self._clock() - self._window_start
+
+        if elapsed < self._window:
+            return
+
+        throughput = self._window_bytes / elapsed
+
+        if throughput < self._min_throughput:
+            raise _RetryableError(f"Download stalled at {throughput:.0f} bytes/s over {elapsed:.1f}s")
+
+        self._window_start += elapsed
+        self._window_bytes = 0
+
+
+# Classes
+
+
+class CircuitBreaker:
+    """Stop making requests to a host after repeated consecutive failures.
+
+    Each download which runs out of retries counts as a single failure, so one
+    download retrying doesn't open the breaker by itself.
+
+    Once open, requests are refused until the reset timeout has passed, after which
+    requests are allowed again. A further failure then opens the breaker again
+    immediately, while a success closes it.
+
+    Args:
+        failure_threshold: The number of consecutive failures which opens the breaker.
+        reset_timeout: The number of seconds to wait before allowing requests again.
+        clock: The function used to get the current time.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+
+    def allow(self) -> bool:
+        """Check whether a request may be made.
+
+        Returns:
+            Whether the breaker is closed, or has been open for longer than the reset timeout.
+        """
+        with self._lock:
+            return self._opened_at is None or self._clock() - self._opened_at >= self.reset_timeout
+
+    def record_failure(self) -> None:
+        """Record a failed request, opening the breaker if there have been too many."""
+        with self._lock:
+            self._failures += 1
+
+            if self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+    def record_success(self) -> None:
+        """Record a successful request, closing the breaker."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+
+# Non-Public Functions
+
+
+def _download_attempt(  # ruff:ignore[too-many-arguments]
+    session: requests.Session,
+    url: str,
+    target: pathlib.Path,
+    *,
+    timeout: tuple[float, float],
+    min_throughput: float,
+    stall_window: float,
+    chunk_size: int,
+) -> None:
+    """Make a single attempt at downloading a file, resuming any partial download in the target.
+
+    Args:
+        session: The session to make the request with.
+        url: The url to download.
+        target: The path to save the file as.
+        timeout: The connect and read timeouts.
+        min_throughput: The minimum acceptable average bytes per second.
+        stall_window: The number of seconds to average the throughput over.
+        chunk_size: The most data to read at once.
+
+    Raises:
+        RuntimeError: If the server responded with an error which is not worth retrying.
+        _RetryableError: If the server responded with an error which is worth retrying, or the download stalled.
+    """
+    offset = target.stat().st_size if target.is_file() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code in _RETRYABLE_STATUSES:
+            raise _RetryableError(
+                f"Returned code {response.status_code}", sidefx.parse_retry_after(response.headers.get("Retry-After"))
+            )
+
+        if response.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE and offset:
+            # The partial file is no use, so start again from scratch.
+            target.unlink()
+            raise _RetryableError("Could not resume download")
+
+        content_range = response.headers.get("Content-Range", "")
+
+        if response.status_code == HTTPStatus.PARTIAL_CONTENT and content_range.startswith(f"bytes {offset}-"):
+            mode = "ab"
+            print(f"Resuming download of {target.name} from {offset} bytes")
+
+        elif response.status_code == HTTPStatus.OK:
+            mode = "wb"
+
+        else:
+            raise RuntimeError(f"Error downloading file. Returned code {response.status_code}")
+
+        response.raw.decode_content = True
+        monitor = _ThroughputMonitor(min_throughput, stall_window)
+
+        with target.open(mode) as handle:
+            # read1() returns whatever data has arrived rather than waiting for a full chunk, so
+            # slow downloads are noticed promptly.
+            while chunk := response.raw.read1(chunk_size):
+                handle.write(chunk)
+                monitor.update(len(chunk))
+
+
+def _get_backoff_delay(attempt: int, base: float, maximum: float, retry_after: float | None) -> float:
+    """Get how long to wait before the next attempt.
+
+    The delay is chosen at random between zero and an exponentially growing cap (full
+    jitter) so that many clients failing at once don't all retry at the same moment.
+
+    Args:
+        attempt: The number of attempts made so far.
+        base: The cap on the delay after the first attempt.
+        maximum: The largest the cap can grow to.
+        retry_after: The number of seconds the server asked us to wait, if any.
+
+    Returns:
+        The delay in seconds.
+    """
+    delay = random.uniform(0, min(maximum, base * 2 ** (attempt - 1)))
+
+    return max(delay, retry_after or 0)
+
+
+# Functions
+
+
+def download_file(  # ruff:ignore[too-many-arguments]
+    url: str,
+    target: pathlib.Path,
+    *,
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    read_timeout: float = DEFAULT_READ_TIMEOUT,
+    min_throughput: float = DEFAULT_MIN_THROUGHPUT,
+    stall_window: float = DEFAULT_STALL_WINDOW,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    backoff_base: float = DEFAULT_BACKOFF_BASE,
+    backoff_max: float = DEFAULT_BACKOFF_MAX,
+    retry_budget: float = DEFAULT_RETRY_BUDGET,
+    circuit_breaker: CircuitBreaker | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> None:
+    """Download a url to a file, retrying and resuming after any transient failures.
+
+    Any existing data in the target is treated as a partial download to be resumed. A
+    download which runs out of retries is recorded as a failure of its host's circuit
+    breaker.
+
+    Args:
+        url: The url to download.
+        target: The path to save the file as.
+        connect_timeout: The number of seconds to wait for a connection.
+        read_timeout: The number of seconds to wait for any data to arrive.
+        min_throughput: The minimum acceptable average bytes per second.
+        stall_window: The number of seconds to average the throughput over.
+        max_attempts: The most attempts to make.
+        backoff_base: The cap on the delay after the first failed attempt.
+        backoff_max: The largest the delay between attempts can be.
+        retry_budget: The most seconds to spend across all attempts and waits.
+        circuit_breaker: The circuit breaker to use. Defaults to the one for the url's host.
+        chunk_size: The most data to read at once.
+
+    Raises:
+        RuntimeError: If the download failed, the retries were exhausted, or the host's circuit breaker is open.
+    """
+    if circuit_breaker is None:
+        circuit_breaker = get_circuit_breaker(url)
+
+    host = urllib.parse.urlsplit(url).netloc
+    start = time.monotonic()
+    attempt = 0
+
+    with requests.Session() as session:
+        while True:
+            if not circuit_breaker.allow():
+                raise RuntimeError(f"Not downloading {target.name}: {host} has failed too many times recently")
+
+            attempt += 1
+
+            try:
+                _download_attempt(
+                    session,
+                    url,
+                    target,
+                    timeout=(connect_timeout, read_timeout),
+                    min_throughput=min_throughput,
+                    stall_window=stall_window,
+                    chunk_size=chunk_size,
+                )
+
+            except _PERMANENT_ERRORS as inst:
+                raise RuntimeError(f"Error downloading file: {inst}") from inst
+
+            # Reading the raw response directly means urllib3 errors aren't wrapped by requests.
+            except (_RetryableError, requests.RequestException, urllib3.exceptions.HTTPError) as inst:
+                error = inst
+
+            else:
+                circuit_breaker.record_success()
+                return
+
+            delay = _get_backoff_delay(attempt, backoff_base, backoff_max, getattr(error, "retry_after", None))
+
+            if attempt >= max_attempts or time.monotonic() - start + delay > retry_budget:
+                circuit_breaker.record_failure()
+                raise RuntimeError(f"Error downloading file after {attempt} attempts: {error}") from error
+
+            print(f"Download attempt {attempt} of {target.name} failed ({error}), retrying in {delay:.1f}s")
+
+            time.sleep(delay)
+
+
+def get_circuit_breaker(url: str) -> CircuitBreaker:
+    """Get the shared circuit breaker for a url's host.
+
+    Args:
+        url: The url which will be requested.
+
+    Returns:
+        The host's circuit breaker.
+    """
+    host = urllib.parse.urlsplit(url).netloc
+
+    with _circuit_breakers_lock:
+        return _circuit_breakers.setdefault(host, CircuitBreaker())
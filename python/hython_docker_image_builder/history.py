@@ -0,0 +1,235 @@
+"""Functions related to recording the history of builds.
+
+The history is a small SQLite database of every build which has been resolved,
+downloaded, built and pushed, along with hashes, sizes, digests and timings. Later
+runs consult it to decide locally whether a build is already done, and it provides
+historical throughput figures for each stage.
+"""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import datetime
+import os
+import pathlib
+import sqlite3
+
+# Globals
+HISTORY_ENV_VAR = "HYTHON_BUILDER_HISTORY"
+
+# The stages of a build which are recorded.
+RESOLVED = "resolved"
+DOWNLOADED = "downloaded"
+BUILT = "built"
+PUSHED = "pushed"
+
+# How long to wait for another process which is writing to the history.
+LOCK_TIMEOUT = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    recorded_at TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    version TEXT NOT NULL,
+    tag_base TEXT,
+    product TEXT,
+    hash TEXT,
+    size INTEGER,
+    digest TEXT,
+    duration REAL
+);
+
+CREATE INDEX IF NOT EXISTS events_stage_version ON events (stage, version);
+
+CREATE TABLE IF NOT EXISTS verified_files (
+    path TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+# Classes
+
+
+class BuildHistory:
+    """A persistent record of builds, stored in a SQLite database.
+
+    The database can be shared by multiple processes.
+
+    Args:
+        path: The database file, which is created if it doesn't exist.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._connection = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+        self._connection.row_factory = sqlite3.Row
+
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    # Methods
+
+    def add_verified_file(self, file_path: pathlib.Path, file_hash: str) -> None:
+        """Record that a file's contents are known to match a hash.
+
+        Args:
+            file_path: The verified file.
+            file_hash: The file's md5 hash.
+        """
+        stat = file_path.stat()
+
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO verified_files (path, hash, size, mtime_ns) VALUES (?, ?, ?, ?)",
+                (file_path.resolve().as_posix(), file_hash, stat.st_size, stat.st_mtime_ns),
+            )
+
+    def close(self) -> None:
+        """Close the database."""
+        self._connection.close()
+
+    def find_pushed(self, tag_base: str, full_version: str) -> dict | None:
+        """Find the most recent push of an image.
+
+        Args:
+            tag_base: The dockerhub user/repo name.
+            full_version: The full image version.
+
+        Returns:
+            The push event, if the image has been pushed.
+        """
+        row = self._connection.execute(
+            "SELECT * FROM events WHERE stage = ? AND version = ? AND tag_base = ? ORDER BY id DESC LIMIT 1",
+            (PUSHED, full_version, tag_base),
+        ).fetchone()
+
+        return dict(row) if row is not None else None
+
+    def get_events(self, full_version: str | None = None) -> list[dict]:
+        """Get the recorded events, oldest first.
+
+        Args:
+            full_version: Only get the events for this version.
+
+        Returns:
+            The events.
+        """
+        if full_version is None:
+            rows = self._connection.execute("SELECT * FROM events ORDER BY id")
+
+        else:
+            rows = self._connection.execute("SELECT * FROM events WHERE version = ? ORDER BY id", (full_version,))
+
+        return [dict(row) for row in rows]
+
+    def get_stage_statistics(self) -> list[dict]:
+        """Get the historical timings and throughput of each stage.
+
+        Returns:
+            For each stage, and product where relevant, the number of timed events, the
+            mean and longest durations in seconds, and the mean bytes per second for
+            events with a size.
+        """
+        rows = self._connection.execute(
+            """
+            SELECT
+                stage,
+                product,
+                COUNT(*) AS count,
+                AVG(duration) AS mean_duration,
+                MAX(duration) AS max_duration,
+                SUM(size) / NULLIF(SUM(CASE WHEN size IS NOT NULL THEN duration END), 0) AS bytes_per_second
+            FROM events
+            WHERE duration IS NOT NULL
+            GROUP BY stage, product
+            ORDER BY stage, product
+            """
+        )
+
+        return [dict(row) for row in rows]
+
+    def is_verified_file(self, file_path: pathlib.Path, expected_hash: str) -> bool:
+        """Check whether a file is unchanged since it was verified against a hash.
+
+        Args:
+            file_path: The file to check.
+            expected_hash: The expected md5 hash.
+
+        Returns:
+            Whether the file was verified against the hash and hasn't changed since.
+        """
+        if not file_path.is_file():
+            return False
+
+        stat = file_path.stat()
+
+        row = self._connection.execute(
+            "SELECT 1 FROM verified_files WHERE path = ? AND hash = ? AND size = ? AND mtime_ns = ?",
+            (file_path.resolve().as_posix(), expected_hash, stat.st_size, stat.st_mtime_ns),
+        ).fetchone()
+
+        return row is not None
+
+    def record(  # ruff:ignore[too-many-arguments]
+        self,
+        stage: str,
+        full_version: str,
+        *,
+        tag_base: str | None = None,
+        product: str | None = None,
+        file_hash: str | None = None,
+        size: int | None = None,
+        digest: str | None = None,
+        duration: float | None = None,
+    ) -> None:
+        """Record a build event.
+
+        Args:
+            stage: The build stage which happened.
+            full_version: The full Houdini version.
+            tag_base: The dockerhub user/repo name, for built and pushed images.
+            product: The product name, for downloads.
+            file_hash: The md5 hash of a downloaded file.
+            size: The size in bytes of a downloaded file.
+            digest: The digest of a built or pushed image.
+            duration: How long the stage took, in seconds.
+        """
+        with self._connection:
+            self._connection.execute(
+                """
+                INSERT INTO events (recorded_at, stage, version, tag_base, product, hash, size, digest, duration)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    datetime.datetime.now(datetime.UTC).isoformat(timespec="seconds"),
+                    stage,
+                    full_version,
+                    tag_base,
+                    product,
+                    file_hash,
+                    size,
+                    digest,
+                    duration,
+                ),
+            )
+
+
+# Functions
+
+
+def get_default_path() -> pathlib.Path | None:
+    """Get the history database path set in the environment.
+
+    Returns:
+        The history database path, if set.
+    """
+    path = os.environ.get(HISTORY_ENV_VAR)
+
+    return pathlib.Path(path) if path else None
@@ -0,0 +1,266 @@
+"""Functions related to sharing downloaded installers between machines.
+
+A mirror store is a directory of verified installer files, each named by its md5
+hash as reported by the SideFX Web API. The store can be served over HTTP so that
+other machines can fetch installers from it instead of downloading them from SideFX.
+"""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import hashlib
+import http.server
+import os
+import re
+import shutil
+import threading
+from http import HTTPStatus
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pathlib
+
+# Globals
+MIRROR_URL_ENV_VAR = "HYTHON_BUILDER_MIRROR_URL"
+
+_PATH_PATTERN = re.compile(r"^/([0-9a-f]{32})$")
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Non-Public Classes
+
+
+class _VerifiedFiles:
+    """A thread-safe record of store files whose checksums are known to be correct.
+
+    Files are only hashed the first time they are requested, or again if they have
+    changed since.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._verified: dict[pathlib.Path, tuple[int, int]] = {}
+
+    def is_verified(self, file_path: pathlib.Path, expected_hash: str) -> bool:
+        """Check whether a file's contents match the expected hash.
+
+        Args:
+            file_path: The file to check.
+            expected_hash: The expected md5 hash.
+
+        Returns:
+            Whether the file matches.
+        """
+        stat = file_path.stat()
+        key = (stat.st_size, stat.st_mtime_ns)
+
+        with self._lock:
+            if self._verified.get(file_path) == key:
+                return True
+
+        # Hash outside the lock so requests for other files aren't held up.
+        with file_path.open("rb") as handle:
+            digest = hashlib.file_digest(handle, "md5")
+
+        if digest.hexdigest() != expected_hash:
+            return False
+
+        with self._lock:
+            self._verified[file_path] = key
+
+        return True
+
+
+class _MirrorServer(http.server.ThreadingHTTPServer):
+    """A threaded HTTP server which serves files from a mirror store.
+
+    Args:
+        server_address: The host and port to serve on.
+        store: The mirror store directory.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address: tuple[str, int], store: pathlib.Path) -> None:
+        super().__init__(server_address, _MirrorRequestHandler)
+        self.store = store
+        self.verified_files = _VerifiedFiles()
+
+
+class _MirrorRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serve verified installer files by md5 hash, with support for byte ranges."""
+
+    protocol_version = "HTTP/1.1"
+    server: _MirrorServer
+
+    def _send_file(self, *, include_body: bool) -> None:
+        """Send the requested file, or an error if it is unavailable.
+
+        Args:
+            include_body: Whether to send the file contents.
+        """
+        match = _PATH_PATTERN.match(self.path)
+        file_path = self.server.store / match.group(1) if match else None
+
+        if (
+            file_path is None
+            or not file_path.is_file()
+            or not self.server.verified_files.is_verified(file_path, file_path.name)
+        ):
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        size = file_path.stat().st_size
+
+        try:
+            byte_range = _parse_range(self.headers.get("Range"), size)
+
+        except ValueError:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start, end = byte_range or (0, size - 1)
+
+        if byte_range is None:
+            self.send_response(HTTPStatus.OK)
+
+        else:
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+
+        if include_body:
+            self.wfile.flush()
+
+            # Let the kernel copy the file straight to the socket where possible.
+            with file_path.open("rb") as handle:
+                self.connection.sendfile(handle, start, end - start + 1)
+
+    def do_GET(self) -> None:
+        """Respond to a GET request."""
+        self._send_file(include_body=True)
+
+    def do_HEAD(self) -> None:
+        """Respond to a HEAD request."""
+        self._send_file(include_body=False)
+
+    def log_message(self, format: str, *args: object) -> None:  # ruff:ignore[builtin-argument-shadowing]
+        """Log a request, prefixed with the client address.
+
+        Args:
+            format: The message format string.
+            *args: The values to format the message with.
+        """
+        print(f"{self.address_string()} - {format % args}", flush=True)
+
+
+# Non-Public Functions
+
+
+def _parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Parse a Range header for a single byte range.
+
+    Args:
+        header: The Range header value, if any.
+        size: The size of the requested file.
+
+    Returns:
+        The first and last (inclusive) bytes to send, or None if the whole file should be sent.
+
+    Raises:
+        ValueError: If the range cannot be satisfied.
+    """
+    if header is None:
+        return None
+
+    match = _RANGE_PATTERN.match(header.strip())
+
+    # Multiple or malformed ranges can be ignored and the whole file sent instead.
+    if match is None or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+
+    if not first:
+        # A suffix range, for the last N bytes.
+        start = max(size - int(last), 0)
+        end = size - 1
+
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+
+    if start > end or start >= size:
+        raise ValueError(f"Unsatisfiable range: {header}")
+
+    return start, end
+
+
+# Functions
+
+
+def add_to_store(store: pathlib.Path, file_path: pathlib.Path, expected_hash: str) -> pathlib.Path:
+    """Add a verified file to a mirror store.
+
+    The file is copied rather than linked so that later writes to the original
+    file can never change the stored contents.
+
+    Args:
+        store: The mirror store directory.
+        file_path: The verified file to add.
+        expected_hash: The md5 hash of the file.
+
+    Returns:
+        The path of the file in the store.
+    """
+    store.mkdir(parents=True, exist_ok=True)
+    stored_path = store / expected_hash
+
+    if stored_path.exists():
+        return stored_path
+
+    temp_path = store / f".{expected_hash}.{os.getpid()}.tmp"
+
+    shutil.copyfile(file_path, temp_path)
+
+    # Rename into place so readers never see a partially written file.
+    temp_path.replace(stored_path)
+
+    print(f"Added {file_path.name} to mirror store as {stored_path.resolve().as_posix()}")
+
+    return stored_path
+
+
+def build_server(store: pathlib.Path, host: str, port: int) -> http.server.ThreadingHTTPServer:
+    """Build a server for a mirror store.
+
+    Args:
+        store: The mirror store directory.
+        host: The host address to serve on.
+        port: The port to serve on. Pass 0 to pick any free port.
+
+    Returns:
+        The server.
+    """
+    return _MirrorServer((host, port), store)
+
+
+def serve(store: pathlib.Path, host: str, port: int) -> None:
+    """Serve a mirror store until interrupted.
+
+    Args:
+        store: The mirror store directory.
+        host: The host address to serve on.
+        port: The port to serve on.
+    """
+    with build_server(store, host, port) as server:
+        print(f"Serving {store.resolve().as_posix()} on http://{host}:{server.server_port}", flush=True)
+
+        server.serve_forever()
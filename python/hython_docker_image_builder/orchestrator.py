@@ -0,0 +1,346 @@
+"""Functions related to building multiple images concurrently."""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import contextlib
+import datetime
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, TYPE_CHECKING
+
+# hython_docker_image_builder
+from hython_docker_image_builder import docker, history
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+# Globals
+CPUS_PER_BUILD = 4
+
+# The amount of free disk space a single build is expected to need. This covers the
+# installer files, the build context and the unpacked Houdini installation layers, and
+# fits within the free space of a standard GitHub hosted runner.
+DEFAULT_DISK_PER_BUILD = 12 * 1024**3
+
+# Non-Public Classes
+
+
+class _ResourceBudget:
+    """Limit concurrent builds by the number of available job slots and free disk space.
+
+    Args:
+        max_jobs: The maximum number of builds which can run at once.
+        disk_bytes: The amount of disk space available to all running builds.
+    """
+
+    def __init__(self, max_jobs: int, disk_bytes: int) -> None:
+        self._condition = threading.Condition()
+        self._jobs = max_jobs
+        self._disk_bytes = disk_bytes
+
+    @contextlib.contextmanager
+    def reserve(self, disk_bytes: int) -> Generator[None]:
+        """Wait until a job slot and enough disk space are available and hold them.
+
+        Args:
+            disk_bytes: The amount of disk space to hold.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._jobs > 0 and self._disk_bytes >= disk_bytes)
+            self._jobs -= 1
+            self._disk_bytes -= disk_bytes
+
+        try:
+            yield
+
+        finally:
+            with self._condition:
+                self._jobs += 1
+                self._disk_bytes += disk_bytes
+                self._condition.notify_all()
+
+
+# Non-Public Functions
+
+
+def _get_default_max_jobs() -> int:
+    """Get the default number of builds to run at once based on the CPU count.
+
+    Returns:
+        The number of concurrent builds.
+    """
+    return max(1, (os.cpu_count() or 1) // CPUS_PER_BUILD)
+
+
+def _get_alias_versions(builds: list[dict]) -> set[str]:
+    """Determine which builds should be tagged with their major.minor alias.
+
+    Only the newest build of each major.minor is aliased, so concurrent builds of the
+    same series can't leave the alias pointing at an older build.
+
+    Args:
+        builds: The build information returned by builder.check_build_can_be_installed() for each version.
+
+    Returns:
+        The full versions of the builds to alias.
+    """
+    newest: dict[str, dict] = {}
+
+    for build_info in builds:
+        current = newest.get(build_info["version"])
+
+        if current is None or int(build_info["build"]) > int(current["build"]):
+            newest[build_info["version"]] = build_info
+
+    return {f"{version}.{build_info['build']}" for version, build_info in newest.items()}
+
+
+def _read_image_digest(metadata_path: pathlib.Path) -> str | None:
+    """Read the image digest from a buildx metadata file.
+
+    Args:
+        metadata_path: The file written by buildx's --metadata-file option.
+
+    Returns:
+        The image digest, if the build wrote one.
+    """
+    if not metadata_path.is_file():
+        return None
+
+    return json.loads(metadata_path.read_text(encoding="utf-8")).get("containerimage.digest")
+
+
+def _stream_output(stream: IO[str], prefix: str, log_file: IO[str]) -> None:
+    """Print and log each line of build output with a timestamp and the build name.
+
+    Args:
+        stream: The build process output.
+        prefix: The build name to prefix each line with.
+        log_file: The file to also write each line to.
+    """
+    for line in stream:
+        timestamp = datetime.datetime.now(datetime.UTC).isoformat(timespec="milliseconds")
+        stamped = f"{timestamp} [{prefix}] {line.rstrip()}"
+
+        print(stamped, flush=True)
+        log_file.write(f"{stamped}\n")
+
+
+# Functions
+
+
+def build_buildx_command(  # ruff:ignore[too-many-arguments]
+    build_info: dict,
+    tag_base: str,
+    dockerfiles_dir: pathlib.Path,
+    *,
+    push: bool,
+    alias: bool = True,
+    docker_executable: str = "docker",
+    metadata_file: pathlib.Path | None = None,
+) -> list[str]:
+    """Build the command used to build an image.
+
+    Args:
+        build_info: The build information returned by builder.check_build_can_be_installed().
+        tag_base: The dockerhub user/repo name.
+        dockerfiles_dir: The directory containing the versioned dockerfile directories.
+        push: Whether to push the image instead of loading it locally.
+        alias: Whether to also tag the image with its major.minor version.
+        docker_executable: The docker executable to run.
+        metadata_file: A file for buildx to write the build result metadata, including the image digest, to.
+
+    Returns:
+        The command arguments.
+    """
+    full_version = f"{build_info['version']}.{build_info['build']}"
+
+    command = [
+        docker_executable,
+        "buildx",
+        "build",
+        "--build-arg",
+        f"HOUDINI_VERSION={full_version}",
+        "--build-arg",
+        f"HOUDINI_INSTALLER_FILENAME={build_info['launcher_name']}",
+        "--build-arg",
+        f"HOUDINI_ISO_FILENAME={build_info['iso_name']}",
+    ]
+
+    # Tag the image with the full version and the major.minor (e.g., 20.0.724, 20.0)
+    for version in (full_version, build_info["version"]) if alias else (full_version,):
+        command.extend(["--tag", docker.build_full_tag_name(tag_base, version)])
+
+    if metadata_file is not None:
+        command.extend(["--metadata-file", metadata_file.as_posix()])
+
+    command.extend(("--push" if push else "--load", (dockerfiles_dir / build_info["version"]).as_posix()))
+
+    return command
+
+
+def run_build(  # ruff:ignore[too-many-arguments]
+    build_info: dict,
+    tag_base: str,
+    budget: _ResourceBudget,
+    log_dir: pathlib.Path,
+    *,
+    dockerfiles_dir: pathlib.Path,
+    disk_per_build: int,
+    push: bool,
+    alias: bool,
+    docker_executable: str,
+) -> dict:
+    """Build a single image once the budget allows it.
+
+    Args:
+        build_info: The build information returned by builder.check_build_can_be_installed().
+        tag_base: The dockerhub user/repo name.
+        budget: The shared resource budget.
+        log_dir: The directory to write the build log to.
+        dockerfiles_dir: The directory containing the versioned dockerfile directories.
+        disk_per_build: The amount of disk space to reserve for the build.
+        push: Whether to push the image instead of loading it locally.
+        alias: Whether to also tag the image with its major.minor version.
+        docker_executable: The docker executable to run.
+
+    Returns:
+        A dictionary containing information about the build result.
+    """
+    full_version = f"{build_info['version']}.{build_info['build']}"
+    metadata_path = log_dir / f"build_{full_version}.metadata.json"
+    command = build_buildx_command(
+        build_info,
+        tag_base,
+        dockerfiles_dir,
+        push=push,
+        alias=alias,
+        docker_executable=docker_executable,
+        metadata_file=metadata_path,
+    )
+    log_path = log_dir / f"build_{full_version}.log"
+
+    with budget.reserve(disk_per_build), log_path.open("w", encoding="utf-8") as log_file:
+        start = time.perf_counter()
+
+        with subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8", errors="replace"
+        ) as process:
+            _stream_output(process.stdout, full_version, log_file)  # ty: ignore[invalid-argument-type]
+
+        duration = time.perf_counter() - start
+
+    return {
+        "version": build_info["version"],
+        "build": build_info["build"],
+        "returncode": process.returncode,
+        "duration": duration,
+        "digest": _read_image_digest(metadata_path),
+        "log_path": log_path,
+    }
+
+
+def run_builds(  # ruff:ignore[too-many-arguments]
+    builds: list[dict],
+    tag_base: str,
+    log_dir: pathlib.Path,
+    *,
+    dockerfiles_dir: pathlib.Path | None = None,
+    max_jobs: int | None = None,
+    disk_per_build: int = DEFAULT_DISK_PER_BUILD,
+    disk_path: pathlib.Path | None = None,
+    push: bool = False,
+    docker_executable: str = "docker",
+    build_history: history.BuildHistory | None = None,
+) -> list[dict]:
+    """Build images for multiple versions concurrently.
+
+    Builds are started as soon as a job slot and enough free disk space are available.
+    Any empty build information (the result of a build being skipped) is ignored. Only
+    the newest build of each major.minor version is tagged with the major.minor alias.
+    Successful builds, and pushes, are recorded to the build history if one is passed.
+
+    Args:
+        builds: The build information returned by builder.check_build_can_be_installed() for each version.
+        tag_base: The dockerhub user/repo name.
+        log_dir: The directory to write build logs to.
+        dockerfiles_dir: The directory containing the versioned dockerfile directories.
+        max_jobs: The maximum number of builds to run at once.
+        disk_per_build: The amount of disk space each build needs.
+        disk_path: The path whose free disk space limits the builds.
+        push: Whether to push the images instead of loading them locally.
+        docker_executable: The docker executable to run.
+        build_history: The build history to record the results to.
+
+    Returns:
+        The build results, in the same order as the builds.
+
+    Raises:
+        RuntimeError: If there is not enough disk space for any build, or if any of the builds failed.
+    """
+    builds = [build_info for build_info in builds if build_info]
+
+    if not builds:
+        return []
+
+    if dockerfiles_dir is None:
+        dockerfiles_dir = pathlib.Path.cwd() / "dockerfiles"
+
+    free_disk = shutil.disk_usage(disk_path or dockerfiles_dir).free
+
+    if free_disk < disk_per_build:
+        raise RuntimeError(f"Not enough free disk space to build: {free_disk} < {disk_per_build} bytes")
+
+    budget = _ResourceBudget(max_jobs or _get_default_max_jobs(), free_disk)
+    alias_versions = _get_alias_versions(builds)
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=len(builds)) as executor:
+        futures = [
+            executor.submit(
+                run_build,
+                build_info,
+                tag_base,
+                budget,
+                log_dir,
+                dockerfiles_dir=dockerfiles_dir,
+                disk_per_build=disk_per_build,
+                push=push,
+                alias=f"{build_info['version']}.{build_info['build']}" in alias_versions,
+                docker_executable=docker_executable,
+            )
+            for build_info in builds
+        ]
+
+    results = [future.result() for future in futures]
+
+    failed = []
+
+    for result in results:
+        full_version = f"{result['version']}.{result['build']}"
+        print(f"Built {full_version} in {result['duration']:.1f}s with exit code {result['returncode']}")
+
+        if result["returncode"]:
+            failed.append(full_version)
+
+        elif build_history is not None:
+            build_history.record(
+                history.BUILT, full_version, tag_base=tag_base, digest=result["digest"], duration=result["duration"]
+            )
+
+            # Pushing is part of the build, so its time is already counted above.
+            if push:
+                build_history.record(history.PUSHED, full_version, tag_base=tag_base, digest=result["digest"])
+
+    if failed:
+        raise RuntimeError(f"Failed to build: {', '.join(failed)}")
+
+    return results
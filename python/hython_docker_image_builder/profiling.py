@@ -0,0 +1,245 @@
+"""Functions related to profiling the time and memory used by each stage of a build check.
+
+Profiling is off unless enabled, in which case each stage wrapped in stage() records
+cProfile call statistics and tracemalloc peak memory and top allocations. The results
+are written to an output directory once profiling is finished.
+"""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import contextlib
+import cProfile
+import json
+import os
+import pathlib
+import re
+import time
+import tracemalloc
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+# Globals
+PROFILE_ENV_VAR = "HYTHON_BUILDER_PROFILE"
+
+PROFILE_DIR_NAME = "hython_builder_profile"
+
+SUMMARY_FILE_NAME = "summary.json"
+
+TOP_ALLOCATIONS = 10
+
+# The profilers enabled by profile(), the last of which records any stages.
+_active_profilers: list[Profiler] = []
+
+# Classes
+
+
+class Profiler:
+    """Record call statistics and memory use for a series of, possibly nested, stages.
+
+    Nested stages are profiled separately: the enclosing stage's call statistics
+    exclude the nested stage, while its peak memory includes it.
+
+    Args:
+        output_dir: The directory to write the results to.
+        top_allocations: The number of allocation sites to record for each stage.
+    """
+
+    def __init__(self, output_dir: pathlib.Path, top_allocations: int = TOP_ALLOCATIONS) -> None:
+        self.output_dir = output_dir
+        self.top_allocations = top_allocations
+        self.stages: list[dict] = []
+
+        # The profile and peak memory seen so far for each stage currently running.
+        self._running: list[tuple[cProfile.Profile, list[int]]] = []
+        self._started_tracing = False
+
+    # Non-Public Methods
+
+    def _write_stats(self, index: int, name: str, profile: cProfile.Profile) -> pathlib.Path:
+        """Write a stage's call statistics.
+
+        Args:
+            index: The stage's position in the order stages were started.
+            name: The stage name.
+            profile: The stage's profile.
+
+        Returns:
+            The path of the written statistics, which can be loaded with pstats.
+        """
+        slug = re.sub(r"[^A-Za-z0-9.]+", "_", name).strip("_")
+        stats_path = self.output_dir / f"{index:02d}_{slug}.prof"
+
+        profile.dump_stats(stats_path)
+
+        return stats_path
+
+    # Methods
+
+    def start(self) -> None:
+        """Start tracing memory allocations, if they aren't already being traced."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self) -> None:
+        """Stop tracing memory allocations if they were started by this profiler."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Generator[None]:
+        """Profile a stage.
+
+        Args:
+            name: The stage name.
+        """
+        self.start()
+
+        record: dict = {"name": name}
+        self.stages.append(record)
+        index = len(self.stages)
+
+        # Pause the enclosing stage, noting its peak so far since the peak is about to be reset.
+        if self._running:
+            parent_profile, parent_peak = self._running[-1]
+            parent_profile.disable()
+            parent_peak[0] = max(parent_peak[0], tracemalloc.get_traced_memory()[1])
+
+        start_snapshot = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start_bytes = tracemalloc.get_traced_memory()[0]
+
+        profile = cProfile.Profile()
+        peak = [start_bytes]
+        self._running.append((profile, peak))
+
+        start = time.perf_counter()
+        profile.enable()
+
+        try:
+            yield
+
+        finally:
+            profile.disable()
+            duration = time.perf_counter() - start
+
+            self._running.pop()
+            peak[0] = max(peak[0], tracemalloc.get_traced_memory()[1])
+
+            statistics = tracemalloc.take_snapshot().compare_to(start_snapshot, "lineno")
+
+            record.update({
+                "duration": duration,
+                "start_bytes": start_bytes,
+                "peak_bytes": peak[0],
+                "peak_increase_bytes": peak[0] - start_bytes,
+                "top_allocations": [
+                    {
+                        "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                        "size_diff": stat.size_diff,
+                        "count_diff": stat.count_diff,
+                    }
+                    for stat in statistics[: self.top_allocations]
+                ],
+                "stats_path": self._write_stats(index, name, profile).as_posix(),
+            })
+
+            # Resume the enclosing stage, which includes this stage's peak.
+            if self._running:
+                parent_profile, parent_peak = self._running[-1]
+                parent_peak[0] = max(parent_peak[0], peak[0])
+                tracemalloc.reset_peak()
+                parent_profile.enable()
+
+    def write_summary(self) -> pathlib.Path:
+        """Write and print a summary of all the profiled stages.
+
+        Returns:
+            The path of the written summary.
+        """
+        summary_path = self.output_dir / SUMMARY_FILE_NAME
+        summary_path.write_text(json.dumps(self.stages, indent=4), encoding="utf-8")
+
+        print(f"Profile results written to {self.output_dir.resolve().as_posix()}")
+
+        for record in self.stages:
+            print(
+                f"  {record['name']}: {record['duration']:.3f}s, "
+                f"peak {record['peak_increase_bytes'] / 1024**2:.2f} MiB above "
+                f"{record['start_bytes'] / 1024**2:.2f} MiB"
+            )
+
+        return summary_path
+
+
+# Functions
+
+
+def get_default_output_dir() -> pathlib.Path:
+    """Get the directory to write profile results to.
+
+    When running in GitHub Actions the results are written next to the $GITHUB_OUTPUT
+    file so they can be uploaded as artifacts, otherwise they go in the current directory.
+
+    Returns:
+        The output directory.
+    """
+    github_output = os.environ.get("GITHUB_OUTPUT")
+    base_dir = pathlib.Path(github_output).parent if github_output else pathlib.Path.cwd()
+
+    return base_dir / PROFILE_DIR_NAME
+
+
+def is_enabled_by_env() -> bool:
+    """Check whether profiling was requested through the environment.
+
+    Returns:
+        Whether the profile environment variable is set to a true value.
+    """
+    return os.environ.get(PROFILE_ENV_VAR, "").lower() in {"1", "true", "yes", "on"}
+
+
+@contextlib.contextmanager
+def profile(output_dir: pathlib.Path | None = None) -> Generator[Profiler]:
+    """Enable profiling of all stages run within the context and write the results afterwards.
+
+    Args:
+        output_dir: The directory to write the results to. Defaults to get_default_output_dir().
+
+    Yields:
+        The active profiler.
+    """
+    output_dir = output_dir or get_default_output_dir()
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    profiler = Profiler(output_dir)
+    profiler.start()
+    _active_profilers.append(profiler)
+
+    try:
+        yield profiler
+
+    finally:
+        _active_profilers.remove(profiler)
+        profiler.stop()
+        profiler.write_summary()
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Generator[None]:
+    """Profile a stage if profiling is enabled.
+
+    Args:
+        name: The stage name.
+    """
+    if not _active_profilers:
+        yield
+        return
+
+    with _active_profilers[-1].stage(name):
+        yield
@@ -0,0 +1,241 @@
+"""Functions related to watching for new Houdini releases."""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import random
+import time
+from operator import itemgetter
+from typing import TYPE_CHECKING
+
+# Third Party
+import requests
+
+# hython_docker_image_builder
+import sidefx
+from hython_docker_image_builder import builder
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+# Globals
+DEFAULT_MIN_INTERVAL = 60.0
+DEFAULT_MAX_INTERVAL = 900.0
+DEFAULT_JITTER = 0.1
+
+# Non-Public Functions
+
+
+def _apply_jitter(interval: float, jitter: float) -> float:
+    """Randomly offset an interval so multiple watchers don't poll in lockstep.
+
+    Args:
+        interval: The base interval, in seconds.
+        jitter: The maximum fraction of the interval to offset by.
+
+    Returns:
+        The jittered interval.
+    """
+    return interval * random.uniform(1 - jitter, 1 + jitter)
+
+
+def _build_release_key(release: dict) -> str:
+    """Build a unique key for a release.
+
+    Args:
+        release: The release information dictionary.
+
+    Returns:
+        The {major.minor.build} version of the release.
+    """
+    return f"{release['version']}.{release['build']}"
+
+
+def _find_new_releases(seen: set[str], releases: list[dict]) -> list[dict]:
+    """Find any releases which have not previously been seen.
+
+    Args:
+        seen: The keys of all previously seen releases.
+        releases: The currently available releases.
+
+    Returns:
+        The unseen releases, ordered from oldest to newest.
+    """
+    new_releases = [release for release in releases if _build_release_key(release) not in seen]
+    new_releases.sort(key=itemgetter("date"))
+
+    return new_releases
+
+
+def _get_next_interval(interval: float, min_interval: float, max_interval: float, *, found_new: bool) -> float:
+    """Determine how long to wait before polling again.
+
+    Polling returns to the minimum interval as soon as something new is found, since
+    SideFX tends to publish related builds close together, and otherwise backs off
+    towards the maximum interval.
+
+    Args:
+        interval: The current interval, in seconds.
+        min_interval: The shortest allowed interval, in seconds.
+        max_interval: The longest allowed interval, in seconds.
+        found_new: Whether the last poll found any new releases.
+
+    Returns:
+        The next interval, in seconds.
+    """
+    if found_new:
+        return min_interval
+
+    return min(interval * 2, max_interval)
+
+
+def _get_initial_seen(releases: list[dict], is_known: Callable[[dict], bool] | None) -> set[str]:
+    """Determine which of the releases available when watching starts count as seen.
+
+    Any releases newer than the newest known release were published while nothing was
+    watching, so are left unseen to be reported. If no release is known at all only the
+    newest is left unseen, rather than reporting every historical release.
+
+    Args:
+        releases: The currently available releases.
+        is_known: A callable which checks whether a release has already been handled, if any.
+
+    Returns:
+        The keys of the releases to treat as seen.
+    """
+    keys = [_build_release_key(release) for release in sorted(releases, key=itemgetter("date"), reverse=True)]
+
+    if is_known is None:
+        return set(keys)
+
+    by_key = {_build_release_key(release): release for release in releases}
+
+    for index, key in enumerate(keys):
+        if is_known(by_key[key]):
+            return set(keys[index:])
+
+    return set(keys[1:])
+
+
+def _list_releases(service: sidefx._Service, major_minor: str | None) -> list[dict]:
+    """Get the list of available production releases.
+
+    Args:
+        service: The SideFX Web API connection.
+        major_minor: The {major.minor} version to list releases for, if any.
+
+    Returns:
+        The available releases.
+    """
+    return service.download.get_daily_builds_list(
+        product="houdini",
+        version=major_minor,
+        platform="linux",
+        only_production=True,
+    )
+
+
+def _report_new_release(release: dict, on_new_release: Callable[[dict], None]) -> bool:
+    """Report a new release, without letting any error stop the watch.
+
+    Args:
+        release: The release information dictionary.
+        on_new_release: The callable to run for the release.
+
+    Returns:
+        Whether the release was handled successfully.
+    """
+    try:
+        on_new_release(release)
+
+    except Exception as inst:  # ruff:ignore[blind-except]
+        print(f"Error handling new release {_build_release_key(release)}, will retry: {inst}")
+        return False
+
+    return True
+
+
+# Functions
+
+
+def watch_releases(  # ruff:ignore[too-many-arguments]
+    get_service: Callable[[], sidefx._Service],
+    version_arg: str,
+    on_new_release: Callable[[dict], None],
+    *,
+    min_interval: float = DEFAULT_MIN_INTERVAL,
+    max_interval: float = DEFAULT_MAX_INTERVAL,
+    jitter: float = DEFAULT_JITTER,
+    max_polls: int | None = None,
+    is_known: Callable[[dict], bool] | None = None,
+) -> None:
+    """Poll the SideFX Web API and report any new production releases.
+
+    On the first poll any releases newer than the newest known release are reported,
+    so releases published while nothing was watching aren't missed. Without a way to
+    tell which releases are known the first poll records the currently available
+    releases without reporting them. The same service connection is kept alive between
+    polls and is only recreated once its access token has expired.
+
+    Failing to connect or list releases, and errors raised by the new release callable,
+    are reported without stopping the watch. A release whose callable raised is reported
+    again on the next poll.
+
+    Args:
+        get_service: A callable which returns a new SideFX Web API connection.
+        version_arg: An optional {major.minor} version to limit the watched releases to.
+        on_new_release: A callable to run for each new release.
+        min_interval: The shortest time to wait between polls, in seconds.
+        max_interval: The longest time to wait between polls, in seconds.
+        jitter: The maximum fraction of the interval to randomly offset each wait by.
+        max_polls: The number of polls to perform before returning, if any.
+        is_known: A callable which checks whether a release has already been handled, if any.
+    """
+    major_minor, _ = builder.determine_version_info(version_arg)
+
+    service: sidefx._Service | None = None
+    seen: set[str] | None = None
+    interval = min_interval
+    polls = 0
+
+    while max_polls is None or polls < max_polls:
+        if polls:
+            time.sleep(_apply_jitter(interval, jitter))
+
+        polls += 1
+
+        if service is not None and service.access_token_expiry_time < time.time():
+            service.close()
+            service = None
+
+        try:
+            if service is None:
+                service = get_service()
+
+            releases = _list_releases(service, major_minor)
+
+        except (requests.RequestException, sidefx.APIError, sidefx.AuthorizationError) as inst:
+            print(f"Error listing releases: {inst}")
+            interval = _get_next_interval(interval, min_interval, max_interval, found_new=False)
+            continue
+
+        if seen is None:
+            seen = _get_initial_seen(releases, is_known)
+            print(f"Watching {len(seen)} existing releases")
+
+            # Only the first poll has happened, so there's no reason to back off yet.
+            if len(seen) == len(releases):
+                continue
+
+        handled = [
+            release for release in _find_new_releases(seen, releases) if _report_new_release(release, on_new_release)
+        ]
+
+        seen.update(_build_release_key(release) for release in handled)
+
+        # Only back off from releases which keep failing, rather than retrying them at the shortest interval.
+        interval = _get_next_interval(interval, min_interval, max_interval, found_new=bool(handled))
+
+    if service is not None:
+        service.close()
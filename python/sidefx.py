@@ -2,8 +2,14 @@ from __future__ import print_function, absolute_import
 import time
 import json
 import base64
-import io
 import html
+import threading
+import email.utils
+import os
+import re
+import binascii
+import codecs
+import hashlib
 
 import requests
 from requests.adapters import HTTPAdapter
@@ -34,11 +40,37 @@ def service(
 
 
 class _Service(object):
-    def __init__(self, endpoint_url, access_token, access_token_expiry_time, timeout):
+    def __init__(
+        self, endpoint_url, access_token, access_token_expiry_time, timeout,
+        rate_limiter=None
+    ):
         self.endpoint_url = endpoint_url
         self.access_token = access_token
         self.access_token_expiry_time = access_token_expiry_time
         self.timeout = timeout
+        # Unless told otherwise, all services share one limiter so that the
+        # combined rate of calls from this process is paced.
+        self.rate_limiter = (
+            rate_limiter if rate_limiter is not None else _shared_rate_limiter)
+        # An optional callable which is passed the number of bytes sent and
+        # the total size of the request whenever an upload makes progress.
+        self.upload_progress = None
+        self._session = None
+
+    @property
+    def session(self):
+        """The pooled HTTP session shared by all calls made through this
+        service, so that repeated calls reuse open connections.
+        """
+        if self._session is None:
+            self._session = _create_session()
+        return self._session
+
+    def close(self):
+        """Close any pooled connections held by this service."""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
 
     def __getattr__(self, attr_name):
         return _APIFunction(attr_name, self)
@@ -62,6 +94,28 @@ class _APIFunction(object):
             args,
             kwargs,
             timeout=self.service.timeout,
+            session=self.service.session,
+            rate_limiter=self.service.rate_limiter,
+            upload_progress=self.service.upload_progress,
+        )
+
+    def iter_items(self, *args, **kwargs):
+        """Call the API function and yield the items of the list it returns
+        as they are received, instead of waiting for and parsing the whole
+        response.  The response is closed once the items have been consumed
+        or the generator is closed.
+        """
+        return call_api_with_access_token(
+            self.service.endpoint_url,
+            self.service.access_token,
+            self.function_name,
+            args,
+            kwargs,
+            timeout=self.service.timeout,
+            session=self.service.session,
+            rate_limiter=self.service.rate_limiter,
+            upload_progress=self.service.upload_progress,
+            stream_items=True,
         )
 
 
@@ -75,21 +129,391 @@ class File(object):
         self.filename = filename
 
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
 class ResponseFile(object):
     """This object is returned from API functions that stream binary content.
-    Call the API function from a `with` statement, and call the read method
-    on the object to read the data in chunks.
+    Call the API function from a `with` statement, and then either call the
+    read or readinto methods on the object to read the data in chunks, iterate
+    over it with `iter_chunks`, or write it straight to disk with `copy_to`.
     """
 
     def __init__(self, response):
         self.response = response
+        # Read through urllib3 so that it decodes the content and checks that
+        # all of it arrived.
+        response.raw.decode_content = True
+        self._stream = response.raw
 
     def __enter__(self):
-        return self.response.raw
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.response.close()
 
+    def read(self, amt=None):
+        """Read and return up to `amt` bytes, or the rest of the content if
+        `amt` is None.
+        """
+        return self._stream.read(amt)
+
+    def readinto(self, buffer):
+        """Read content into a caller-supplied, writable buffer and return the
+        number of bytes read, which is 0 once all the content has been read.
+        """
+        return self._stream.readinto(buffer)
+
+    def iter_chunks(self, size=DOWNLOAD_CHUNK_SIZE):
+        """Yield the content in chunks of up to `size` bytes.
+
+        The chunks are memoryviews over a single buffer that is reused for
+        every chunk, so each one is only valid until the next is requested.
+        Copy it with bytes() if it needs to be kept.
+        """
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        while True:
+            num_bytes = self.readinto(buffer)
+            if not num_bytes:
+                return
+            yield view[:num_bytes]
+
+    def copy_to(self, path, hash_name=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """Write the rest of the content to the file at `path`, hashing it as
+        it is written if a hashlib algorithm name is given in `hash_name`.
+
+        Returns the hex digest of the content if it was hashed, otherwise None.
+        """
+        hasher = hashlib.new(hash_name) if hash_name is not None else None
+        with open(path, "wb") as handle:
+            for chunk in self.iter_chunks(chunk_size):
+                handle.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+
+        return hasher.hexdigest() if hasher is not None else None
+
+
+# ------------------------------------------------------------------------------
+# Code that incrementally parses JSON list responses:
+
+JSON_CHUNK_SIZE = 64 * 1024
+
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_JSON_NUMBER_DELIMITERS = (",", "]", "}", " ", "\t", "\n", "\r")
+
+
+class _JSONArrayReader(object):
+    """Parses the items of a JSON array from an iterable of byte strings,
+    yielding each item as soon as all of it has been received.  Only the
+    unparsed remainder of the input is kept in memory.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._finished = False
+
+    def _read_more(self):
+        """Append the next chunk of input to the buffer, dropping anything
+        that has already been parsed.  Returns False if there is no more input.
+        """
+        if self._finished:
+            return False
+
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._finished = True
+            text = self._text_decoder.decode(b"", final=True)
+        else:
+            text = self._text_decoder.decode(chunk)
+
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """Skip any whitespace and return the next character without
+        consuming it, or None at the end of the input.
+        """
+        while True:
+            self._pos = _JSON_WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read_more():
+                return None
+
+    def _consume(self, characters):
+        """Consume and return the next character, which must be one of
+        `characters`.
+        """
+        character = self._peek()
+        if character is None or character not in characters:
+            raise ValueError(
+                "Expected one of %r in JSON array, found %r" % (characters, character))
+        self._pos += 1
+        return character
+
+    def _decode_item(self):
+        """Decode the next item, reading more input until it is complete."""
+        self._peek()
+        while True:
+            try:
+                item, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if not self._read_more():
+                    raise
+                continue
+
+            # A number which isn't followed by a delimiter yet may continue in
+            # the next chunk.
+            if (
+                isinstance(item, (int, float))
+                and self._buffer[end:end + 1] not in _JSON_NUMBER_DELIMITERS
+                and self._read_more()
+            ):
+                continue
+
+            self._pos = end
+            return item
+
+    def __iter__(self):
+        self._consume("[")
+        if self._peek() == "]":
+            return
+
+        while True:
+            yield self._decode_item()
+            if self._consume(",]") == "]":
+                return
+
+
+def _iter_json_response(response):
+    """Yield the items of a JSON list response as they are received, and
+    close the response once they have all been read or the generator is
+    closed.
+    """
+    try:
+        for item in _JSONArrayReader(response.iter_content(JSON_CHUNK_SIZE)):
+            yield item
+    finally:
+        response.close()
+
+
+# ------------------------------------------------------------------------------
+# Code that streams uploads to the API:
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _quote_header_param(value):
+    """Escape a multipart header parameter value the same way browsers
+    (and urllib3) do.
+    """
+    return value.replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+
+class _MultipartEncoder(object):
+    """Builds a multipart/form-data request body that is produced in
+    fixed-size chunks as it is sent, rather than being assembled in memory.
+
+    `fields` is a list of (name, string value) pairs and `uploads` is a list
+    of (name, filename, File or bytearray) tuples.  File contents are read
+    from disk a chunk at a time and bytearrays are sent through a memoryview
+    so that they are never copied.  The length is known up front so that the
+    request can be sent with a Content-Length instead of chunked encoding.
+
+    Iterating over the encoder produces the body from the start each time,
+    so the same encoder can be used to retry a request.
+    """
+
+    def __init__(
+        self, fields, uploads, chunk_size=UPLOAD_CHUNK_SIZE, progress=None
+    ):
+        self.boundary = binascii.hexlify(os.urandom(16)).decode("ascii")
+        self.content_type = "multipart/form-data; boundary=" + self.boundary
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self._iterators = []
+
+        # A list of either bytes to send as they are, or upload sources.
+        self._parts = []
+        for name, value in fields:
+            self._parts.append(self._part_header(name) + value.encode("utf-8"))
+            self._parts.append(b"\r\n")
+        for name, filename, source in uploads:
+            self._parts.append(self._part_header(name, filename))
+            self._parts.append(source)
+            self._parts.append(b"\r\n")
+        self._parts.append(("--%s--\r\n" % self.boundary).encode("ascii"))
+
+        self.length = sum(self._part_length(part) for part in self._parts)
+
+    def _part_header(self, name, filename=None):
+        disposition = 'form-data; name="%s"' % _quote_header_param(name)
+        header = "--%s\r\nContent-Disposition: " % self.boundary + disposition
+        if filename is not None:
+            header += '; filename="%s"' % _quote_header_param(filename)
+            header += "\r\nContent-Type: application/octet-stream"
+        return (header + "\r\n\r\n").encode("utf-8")
+
+    @staticmethod
+    def _part_length(part):
+        if isinstance(part, File):
+            return os.path.getsize(part.filename)
+        return len(part)
+
+    def _iter_part(self, part):
+        if isinstance(part, bytes):
+            yield part
+        elif isinstance(part, File):
+            with open(part.filename, "rb") as handle:
+                while True:
+                    chunk = handle.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        else:
+            view = memoryview(part)
+            for offset in range(0, len(view), self.chunk_size):
+                yield view[offset:offset + self.chunk_size]
+
+    def _iter_body(self):
+        sent = 0
+        for part in self._parts:
+            for chunk in self._iter_part(part):
+                yield chunk
+                sent += len(chunk)
+                if self.progress is not None:
+                    self.progress(sent, self.length)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        iterator = self._iter_body()
+        self._iterators.append(iterator)
+        return iterator
+
+    def close(self):
+        """Close any files left open by partially sent bodies."""
+        for iterator in self._iterators:
+            iterator.close()
+        self._iterators = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# ------------------------------------------------------------------------------
+# Code that paces calls into the API:
+
+
+class RateLimiter(object):
+    """A thread-safe token bucket used to pace calls into the API.
+
+    Each call takes a token from the bucket, which refills at `rate` tokens
+    per second up to `burst` tokens.  When the server rejects a call with a
+    429 response the rate is halved, and any Retry-After delay blocks all
+    further calls until it has passed.  Each successful call then slowly
+    raises the rate again, up to `max_rate`.
+
+    `reserve` never blocks, so asyncio code can share a limiter with threaded
+    code by awaiting `asyncio.sleep(limiter.reserve())` before each call.
+    """
+
+    def __init__(
+        self, rate=10.0, burst=10, min_rate=0.1, max_rate=None,
+        recovery=0.1, clock=time.monotonic
+    ):
+        self.rate = float(rate)
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else self.rate
+        self.recovery = recovery
+        self._clock = clock
+        self._tokens = float(burst)
+        # The time the bucket was last refilled.  This may be in the future if
+        # the server asked us to back off.
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def reserve(self):
+        """Take a token and return how many seconds to wait before making
+        the call that it pays for.
+        """
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._tokens -= 1
+            delay = max(self._updated - now, 0.0)
+            if self._tokens < 0:
+                delay += -self._tokens / self.rate
+            return delay
+
+    def acquire(self):
+        """Block until a call can be made.  Returns the time waited."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def record_success(self):
+        """Note that a call was accepted by the server."""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.recovery)
+
+    def record_throttle(self, retry_after=None):
+        """Note that a call was rejected by the server because of rate
+        limiting, optionally blocking all calls for `retry_after` seconds.
+        """
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after is not None:
+                self._updated = max(self._updated, now + retry_after)
+
+
+_shared_rate_limiter = RateLimiter()
+
+
+def parse_retry_after(value, now=None):
+    """Return the number of seconds a Retry-After header value asks us to
+    wait, or None if the value is missing or cannot be parsed.  The value
+    may be either a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        retry_time = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if now is None:
+        now = time.time()
+    return max(retry_time.timestamp() - now, 0.0)
+
 
 # ------------------------------------------------------------------------------
 # Code that implements authentication and raw calls into the API:
@@ -142,39 +566,18 @@ class AuthorizationError(Exception):
         self.http_code = http_code
 
 
-def call_api_with_access_token(
-    endpoint_url, access_token, function_name, args, kwargs, timeout=None
-):
-    """Call into the API using an access token that was returned by
-    get_access_token.
+def _create_session():
+    """Create an HTTP session which retries failed connections.  Rate
+    limited requests are handled by call_api_with_access_token so that its
+    rate limiter can learn from them.
     """
-    file_data = {}
-    for arg_name, arg_value in kwargs.items():
-        if isinstance(arg_value, (bytearray, File)):
-            if isinstance(arg_value, File):
-                file_data[arg_name] = (
-                    arg_value.filename,
-                    open(arg_value.filename, "rb"),
-                    "application/octet-stream",
-                )
-            else:
-                file_data[arg_name] = (
-                    "unnamed.bin",
-                    io.BytesIO(arg_value),
-                    "application/octet-stream",
-                )
-    for arg_name in file_data:
-        del kwargs[arg_name]
-
-    post_data = dict(json=json.dumps([function_name, args, kwargs]))
-
     # urllib3 renamed the method_whitelist argument to allowed_methods, so
     # handle different versions of urllib3.
     retry_kwargs = dict(
         total=3,
-        status_forcelist=[429],
         allowed_methods=["GET", "POST"],
         backoff_factor=1,
+        respect_retry_after_header=False,
     )
     try:
         retry_strategy = Retry(**retry_kwargs)
@@ -187,18 +590,71 @@ def call_api_with_access_token(
     http = requests.Session()
     http.mount("https://", adapter)
     http.mount("http://", adapter)
+    return http
+
+
+def call_api_with_access_token(
+    endpoint_url, access_token, function_name, args, kwargs, timeout=None,
+    session=None, rate_limiter=None, max_attempts=4, upload_progress=None,
+    stream_items=False
+):
+    """Call into the API using an access token that was returned by
+    get_access_token.  If a session is passed its pooled connections are
+    reused, otherwise a new session is created for this call.  Calls are
+    paced by the rate limiter, and are attempted up to `max_attempts` times
+    if the server responds that we are being rate limited.  Any File or
+    bytearray arguments are streamed to the server, calling
+    `upload_progress` with the bytes sent and total size as they go.  If
+    `stream_items` is set and the function returns a JSON list, a generator
+    of its items is returned which parses them as they are received.
+    """
+    uploads = []
+    for arg_name, arg_value in list(kwargs.items()):
+        if isinstance(arg_value, File):
+            uploads.append((arg_name, arg_value.filename, arg_value))
+            del kwargs[arg_name]
+        elif isinstance(arg_value, bytearray):
+            uploads.append((arg_name, "unnamed.bin", arg_value))
+            del kwargs[arg_name]
+
+    headers = {"Authorization": "Bearer " + access_token}
+    post_data = dict(json=json.dumps([function_name, args, kwargs]))
+    if uploads:
+        post_data = _MultipartEncoder(
+            list(post_data.items()), uploads, progress=upload_progress)
+        headers["Content-Type"] = post_data.content_type
+
+    http = session if session is not None else _create_session()
+    if rate_limiter is None:
+        rate_limiter = _shared_rate_limiter
+
+    try:
+        for attempt in range(max_attempts):
+            rate_limiter.acquire()
+            response = http.post(
+                endpoint_url,
+                headers=headers,
+                data=post_data,
+                timeout=timeout,
+                stream=True,
+            )
+            if response.status_code != 429:
+                rate_limiter.record_success()
+                break
+
+            rate_limiter.record_throttle(
+                parse_retry_after(response.headers.get("Retry-After")))
+            if attempt < max_attempts - 1:
+                response.close()
+    finally:
+        if uploads:
+            post_data.close()
 
-    response = http.post(
-        endpoint_url,
-        headers={"Authorization": "Bearer " + access_token},
-        data=post_data,
-        timeout=timeout,
-        files=file_data,
-        stream=True,
-    )
     if response.status_code == 200:
         if response.headers.get("Content-Type") == "application/octet-stream":
             return ResponseFile(response)
+        if stream_items:
+            return _iter_json_response(response)
         return response.json()
 
     raise APIError(response.status_code, _extract_traceback_from_response(response))
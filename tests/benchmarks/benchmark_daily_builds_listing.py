@@ -0,0 +1,143 @@
+"""Compare parsing a daily builds listing in full against streaming it.
+
+Run from the repository root with:
+
+    PYTHONPATH=python python tests/benchmarks/benchmark_daily_builds_listing.py
+"""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import argparse
+import contextlib
+import datetime
+import itertools
+import json
+import random
+import time
+import tracemalloc
+from typing import TYPE_CHECKING
+
+# hython_docker_image_builder
+import sidefx
+from hython_docker_image_builder import builder
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+# Globals
+VERSIONS = ("19.0", "19.5", "20.0", "20.5", "21.0", "22.0")
+
+
+def build_listing(count: int) -> bytes:
+    """Build a synthetic daily builds listing, newest first like the SideFX Web API.
+
+    Args:
+        count: The number of releases in the listing.
+
+    Returns:
+        The listing as the JSON encoded response body.
+    """
+    rng = random.Random(0)
+    start = datetime.date(2015, 1, 1)
+
+    releases = [
+        {
+            "build": str(100 + index),
+            "date": (start + datetime.timedelta(days=index // 25)).strftime("%Y/%m/%d"),
+            "platform": "linux_x86_64_gcc11.2",
+            "product": "houdini",
+            "release": rng.choice(("gold", "devel")),
+            "status": "good",
+            "version": rng.choice(VERSIONS),
+        }
+        for index in range(count)
+    ]
+
+    return json.dumps(releases[::-1]).encode()
+
+
+def iter_chunks(data: bytes) -> Iterator[bytes]:
+    """Split a response body into chunks the size the streaming path reads.
+
+    Args:
+        data: The response body.
+
+    Yields:
+        The body chunks.
+    """
+    for start in range(0, len(data), sidefx.JSON_CHUNK_SIZE):
+        yield data[start : start + sidefx.JSON_CHUNK_SIZE]
+
+
+def measure(function: Callable[[], dict]) -> tuple[dict, float, int]:
+    """Measure the time taken and peak memory allocated by a function.
+
+    The function is run twice since tracing memory allocations slows it down.
+
+    Args:
+        function: The function to measure.
+
+    Returns:
+        The function result, the time taken in seconds and the peak memory in bytes.
+    """
+    start = time.perf_counter()
+    result = function()
+    duration = time.perf_counter() - start
+
+    tracemalloc.start()
+
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+
+    finally:
+        tracemalloc.stop()
+
+    return result, duration, peak
+
+
+def main() -> None:
+    """Execute the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=100_000)
+    args = parser.parse_args()
+
+    data = build_listing(args.entries)
+    newest = json.loads(data)[0]
+
+    print(f"Listing of {args.entries} releases, {len(data) / 1024**2:.1f} MiB")
+
+    cases = {
+        "newest production": ("", None),
+        "newest 21.0 production": ("21.0", None),
+        f"specific build {newest['build']}": (newest["version"], newest["build"]),
+    }
+
+    for name, (major_minor, build) in cases.items():
+
+        def parse_all(major_minor: str | None = major_minor or None, build: str | None = build) -> dict:
+            releases = list(builder._filter_releases(json.loads(data), major_minor, only_production=build is None))
+            return builder._determine_release(releases, build)
+
+        def parse_streaming(major_minor: str | None = major_minor or None, build: str | None = build) -> dict:
+            with contextlib.closing(iter(sidefx._JSONArrayReader(iter_chunks(data)))) as items:
+                releases = builder._filter_releases(items, major_minor, only_production=build is None)
+                first_release = next(releases)
+
+                return builder._determine_release(itertools.chain([first_release], releases), build)
+
+        print(f"\n{name}:")
+
+        for label, function in (("full parse", parse_all), ("streaming", parse_streaming)):
+            result, duration, peak = measure(function)
+
+            print(
+                f"  {label:<12} {duration * 1000:8.1f} ms  peak {peak / 1024**2:7.2f} MiB  "
+                f"-> {result['version']}.{result['build']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
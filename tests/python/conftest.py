@@ -0,0 +1,186 @@
+"""Shared fixtures for the hython_docker_image_builder tests."""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import http.server
+import json
+import threading
+import urllib.parse
+from typing import TYPE_CHECKING, Any, ClassVar, NamedTuple
+
+# Third Party
+import pytest
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Generator
+
+
+class StubRequest(NamedTuple):
+    """A request received by a stub server."""
+
+    method: str
+    path: str
+    headers: dict[str, str]
+    body: bytes
+    client_port: int
+
+    def get_api_call(self) -> list:
+        """Get the SideFX Web API call made by a form encoded request."""
+        return json.loads(urllib.parse.parse_qs(self.body.decode())["json"][0])
+
+
+class StubResponse(NamedTuple):
+    """A response for a stub server to send.
+
+    The body is either raw bytes or a value to send as JSON. It is written in pieces of
+    write_size bytes, waiting write_delay seconds before each, and if truncate_at is set
+    the connection is closed after sending only that many bytes of it.
+    """
+
+    status: int = http.HTTPStatus.OK
+    body: Any = b""
+    headers: dict[str, str] | None = None
+    chunked: bool = False
+    write_size: int | None = None
+    write_delay: float = 0.0
+    truncate_at: int | None = None
+
+
+class StubServer:
+    """A running stub server, which sends queued responses and records the requests received.
+
+    Args:
+        responses: The responses to send, in order. The last is repeated for any further requests.
+    """
+
+    def __init__(self, responses: tuple[StubResponse, ...]) -> None:
+        self.url = ""
+        self.requests: list[StubRequest] = []
+        self._responses = list(responses)
+        self._lock = threading.Lock()
+
+    def handle(self, request: StubRequest) -> StubResponse:
+        """Record a request and get the response to send."""
+        with self._lock:
+            self.requests.append(request)
+            return self._responses.pop(0) if len(self._responses) > 1 else self._responses[0]
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Respond to every request with the next response queued on the stub server."""
+
+    stub: ClassVar[StubServer]
+
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self) -> None:
+        """Record the request and send the next response."""
+        length = int(self.headers.get("Content-Length", 0))
+        request = StubRequest(
+            self.command, self.path, dict(self.headers), self.rfile.read(length), self.client_address[1]
+        )
+        response = self.stub.handle(request)
+
+        body = response.body if isinstance(response.body, bytes) else json.dumps(response.body).encode()
+        content_type = "application/octet-stream" if isinstance(response.body, bytes) else "application/json"
+
+        self.send_response(response.status)
+        self.send_header("Content-Type", content_type)
+
+        if response.chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+
+        else:
+            self.send_header("Content-Length", str(len(body)))
+
+        for name, value in (response.headers or {}).items():
+            self.send_header(name, value)
+
+        self.end_headers()
+
+        try:
+            self._write_body(response, body)
+
+        # The client closed the response before reading it all.
+        except OSError:
+            self.close_connection = True
+
+    def _write_body(self, response: StubResponse, body: bytes) -> None:
+        """Write the response body, in pieces and cut short if asked to."""
+        sent = body[: response.truncate_at]
+        write_size = response.write_size or max(len(sent), 1)
+
+        for start in range(0, len(sent), write_size):
+            # Tests often mock time.sleep(), so wait without it.
+            if response.write_delay:
+                threading.Event().wait(response.write_delay)
+
+            piece = sent[start : start + write_size]
+
+            if response.chunked:
+                # A truncated chunk still claims its full size.
+                size = len(body[start : start + write_size])
+                piece = f"{size:x}\r\n".encode() + piece + (b"\r\n" if len(piece) == size else b"")
+
+            self.wfile.write(piece)
+            self.wfile.flush()
+
+        if response.truncate_at is not None:
+            self.close_connection = True
+
+        elif response.chunked:
+            self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self) -> None:
+        """Respond to a GET request."""
+        self._respond()
+
+    def do_POST(self) -> None:
+        """Respond to a POST request."""
+        self._respond()
+
+    def log_message(self, *args: object) -> None:
+        """Silence request logging."""
+
+
+@pytest.fixture
+def local_http_server() -> Generator[Callable[[type[http.server.BaseHTTPRequestHandler]], str]]:
+    """Start local HTTP servers for the duration of a test.
+
+    The fixture value is a callable which starts a server using the passed request
+    handler class and returns the server's base url.
+    """
+    servers = []
+
+    def _start(handler_class: type[http.server.BaseHTTPRequestHandler]) -> str:
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        servers.append(server)
+
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield _start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def stub_server(local_http_server: Callable) -> Callable[..., StubServer]:
+    """Start stub HTTP servers for the duration of a test.
+
+    The fixture value is a callable which starts a server sending the passed
+    responses, each given as a dictionary of StubResponse fields, and returns it.
+    """
+
+    def _start(*responses: dict) -> StubServer:
+        stub = StubServer(tuple(StubResponse(**response) for response in responses))
+        stub.url = local_http_server(type("StubHandler", (StubHandler,), {"stub": stub}))
+
+        return stub
+
+    return _start
@@ -4,19 +4,23 @@
 from __future__ import annotations
 
 # Standard Library
-import http
+import hashlib
+import multiprocessing
+import os
 import pathlib
 from contextlib import nullcontext
 from typing import TYPE_CHECKING
 
 # Third Party
 import pytest
+import requests
 
 # hython_docker_image_builder
 import sidefx
-from hython_docker_image_builder import builder
+from hython_docker_image_builder import builder, history, profiling
 
 if TYPE_CHECKING:
+    from collections.abc import Callable, Generator
     from pathlib import Path
 
     from pytest_mock import MockerFixture
@@ -49,6 +53,44 @@ def test__determine_release(build: str | None, expected: str | None) -> None:
         assert result["build"] == expected
 
 
+@pytest.mark.parametrize(
+    "major_minor,only_production,expected",
+    (
+        (None, False, ["1", "2", "3", "4"]),
+        ("20.0", False, ["1", "3"]),
+        ("20.0", True, ["1"]),
+        (None, True, ["1", "2", "4"]),
+    ),
+)
+def test__filter_releases(major_minor: str | None, only_production: bool, expected: list[str]) -> None:
+    """Test hython_docker_image_builder.build._filter_releases()."""
+    releases = [
+        {"build": "1", "version": "20.0", "release": "gold"},
+        {"build": "2", "version": "19.5", "release": "gold"},
+        {"build": "3", "version": "20.0", "release": "devel"},
+        {"build": "4", "version": "19.5"},
+    ]
+
+    result = builder._filter_releases(iter(releases), major_minor, only_production=only_production)
+
+    assert [release["build"] for release in result] == expected
+
+
+def test__get_newest_releases() -> None:
+    """Test hython_docker_image_builder.build._get_newest_releases()."""
+    releases = [
+        {"build": "1", "date": "2024/10/26"},
+        {"build": "2", "date": "2024/10/27"},
+        {"build": "3", "date": "2024/09/27"},
+        {"build": "4", "date": "2024/10/27"},
+    ]
+
+    result = builder._get_newest_releases(iter(releases), 3)
+
+    # Later releases with the same date are considered newer.
+    assert [release["build"] for release in result] == ["4", "2", "1"]
+
+
 @pytest.mark.parametrize(
     "version_str,expected, context",
     (
@@ -59,35 +101,123 @@ def test__determine_release(build: str | None, expected: str | None) -> None:
         ("", (None, None), nullcontext()),
     ),
 )
-def test__determine_version_info(
+def test_determine_version_info(
     version_str: str, expected: tuple, context: nullcontext | pytest.RaisesExc[RuntimeError]
 ) -> None:
-    """Test hython_docker_image_builder.build._determine_version_info()."""
+    """Test hython_docker_image_builder.build.determine_version_info()."""
     with context:
-        result = builder._determine_version_info(version_str)
+        result = builder.determine_version_info(version_str)
 
         assert result == expected
 
 
-@pytest.mark.parametrize("has_error", (False, True))
-def test__download_file(mocker: MockerFixture, has_error: bool) -> None:
-    """Test hython_docker_image_builder.build._download_file()."""
-    mock_url = mocker.MagicMock(spec=str)
+def test_download_product__peak_memory(mocker: MockerFixture, stub_server: Callable, tmp_path: pathlib.Path) -> None:
+    """Test that downloading and verifying a product uses memory proportional to the chunk size, not the file size."""
+    content = bytes(range(256)) * (128 * 1024)
+
+    url = stub_server({"body": content}).url
+
+    mock_service = mocker.MagicMock()
+    mock_service.download.get_daily_build_download.return_value = {
+        "download_url": f"{url}/installer.iso",
+        "filename": "installer.iso",
+        "hash": hashlib.md5(content).hexdigest(),
+    }
+
+    with profiling.profile(tmp_path / "profile") as profiler:
+        builder.download_product(mock_service, {"version": "21.0", "build": "512"}, "launcher-iso", tmp_path)
+
+    stages = {record["name"]: record for record in profiler.stages}
+
+    assert (tmp_path / "installer.iso").stat().st_size == len(content)
+
+    # Reading the whole file into memory at any point would use over 32MiB.
+    assert stages["download launcher-iso"]["peak_increase_bytes"] < 2 * 1024**2
+    assert stages["checksum launcher-iso"]["peak_increase_bytes"] < 2 * 1024**2
+
+
+@pytest.mark.parametrize("error", (None, RuntimeError("bad checksum"), requests.ConnectionError("refused")))
+def test__download_from_mirror(mocker: MockerFixture, error: Exception | None) -> None:
+    """Test hython_docker_image_builder.build._download_from_mirror()."""
+    mock_download = mocker.patch("hython_docker_image_builder.builder.download.download_file")
+    mock_verify = mocker.patch("hython_docker_image_builder.builder._verify_checksum", side_effect=error)
     mock_target = mocker.MagicMock(spec=pathlib.Path)
 
-    mock_copy = mocker.patch("shutil.copyfileobj")
+    result = builder._download_from_mirror("http://mirror:8000/", "abc123", mock_target)
 
-    mock_get = mocker.patch("requests.get")
-    mock_get.return_value.status_code = http.HTTPStatus.OK if not has_error else http.HTTPStatus.BAD_REQUEST
+    assert result == (error is None)
 
-    context = pytest.raises(RuntimeError) if has_error else nullcontext()
+    mock_download.assert_called_with(
+        "http://mirror:8000/abc123", mock_target, max_attempts=builder.MIRROR_DOWNLOAD_ATTEMPTS
+    )
+    mock_verify.assert_called_with(mock_target, "abc123")
 
-    with context:
-        builder._download_file(mock_url, mock_target)
+    # A failed mirror download must not be resumed from when falling back to SideFX.
+    assert mock_target.unlink.called == (error is not None)
+
+
+class TestDownloadLock:
+    """Test hython_docker_image_builder.builder._download_lock()."""
 
-        mock_copy.assert_called_with(mock_get.return_value.raw, mock_target.open.return_value.__enter__.return_value)
+    def test_stale_partial(self, tmp_path: pathlib.Path, capsys: pytest.CaptureFixture) -> None:
+        """Test that partial downloads left by a crashed process are removed."""
+        target = tmp_path / "installer.iso"
+        lock_path = tmp_path / ".installer.iso.lock"
+        partial = tmp_path / ".installer.iso.12345.part"
 
-    mock_get.assert_called_with(mock_url, stream=True)
+        lock_path.write_text("12345", encoding="utf-8")
+        partial.write_bytes(b"partial")
+
+        with builder._download_lock(target):
+            assert not partial.exists()
+            assert lock_path.read_text(encoding="utf-8") == str(os.getpid())
+
+        assert "left by crashed process 12345" in capsys.readouterr().out
+
+    def test_timeout(self, tmp_path: pathlib.Path, capsys: pytest.CaptureFixture) -> None:
+        """Test waiting for, and then giving up on, a lock held elsewhere."""
+        target = tmp_path / "installer.iso"
+
+        # The lock is held through a separate open file so this waits even within the same process.
+        with (
+            builder._download_lock(target),
+            pytest.raises(RuntimeError, match="Timed out"),
+            builder._download_lock(target, timeout=0.3),
+        ):
+            pass
+
+        assert capsys.readouterr().out.count(f"Waiting for process {os.getpid()}") == 1
+
+
+@pytest.mark.parametrize(
+    "exists,expected_hash,expected", ((False, "", False), (True, "000", False), (True, None, True))
+)
+def test__is_downloaded(shared_datadir: Path, exists: bool, expected_hash: str | None, expected: bool) -> None:
+    """Test hython_docker_image_builder.build._is_downloaded()."""
+    file_path = shared_datadir / ("verify_checksum.txt" if exists else "missing.txt")
+
+    assert builder._is_downloaded(file_path, expected_hash or "b856d9b6874bd71d9f8ecae91df5e423") == expected
+
+
+def test__is_downloaded__history(mocker: MockerFixture, shared_datadir: Path, tmp_path: pathlib.Path) -> None:
+    """Test hython_docker_image_builder.build._is_downloaded() skipping files the build history shows are verified."""
+    file_path = shared_datadir / "verify_checksum.txt"
+    expected_hash = "b856d9b6874bd71d9f8ecae91df5e423"
+
+    mock_verify = mocker.spy(builder, "_verify_checksum")
+    build_history = history.BuildHistory(tmp_path / "history.sqlite")
+
+    try:
+        assert not builder._is_downloaded(file_path, "000", build_history)
+        assert builder._is_downloaded(file_path, expected_hash, build_history)
+        assert mock_verify.call_count == 2
+
+        # The file was recorded as verified, so isn't hashed again.
+        assert builder._is_downloaded(file_path, expected_hash, build_history)
+        assert mock_verify.call_count == 2
+
+    finally:
+        build_history.close()
 
 
 def test__verify_checksum(shared_datadir: Path) -> None:
@@ -162,7 +292,71 @@ def test_check_build_can_be_installed(
             }
 
 
-def test_download_product(mocker: MockerFixture) -> None:
+@pytest.mark.parametrize(
+    "pushed,tag_exists,force", ((True, False, False), (True, False, True), (True, True, True), (False, True, False))
+)
+def test_check_build_can_be_installed__history(
+    mocker: MockerFixture, tmp_path: pathlib.Path, pushed: bool, tag_exists: bool, force: bool
+) -> None:
+    """Test hython_docker_image_builder.build.check_build_can_be_installed() with a build history."""
+    mocker.patch(
+        "hython_docker_image_builder.builder.get_target_release", return_value={"version": "21.0", "build": "512"}
+    )
+    mock_check = mocker.patch("hython_docker_image_builder.builder.docker.check_tag_exists", return_value=tag_exists)
+    mock_download = mocker.patch("hython_docker_image_builder.builder.download_product")
+
+    build_history = history.BuildHistory(tmp_path / "history.sqlite")
+
+    try:
+        if pushed:
+            build_history.record(history.PUSHED, "21.0.512", tag_base="name/repo")
+
+        result = builder.check_build_can_be_installed(
+            mocker.MagicMock(), "21.0", "name/repo", force=force, build_history=build_history
+        )
+
+        # The registry is only checked if the history doesn't already show the build was pushed.
+        if pushed and not force:
+            assert result == {}
+            mock_check.assert_not_called()
+
+        else:
+            mock_check.assert_called_with("name/repo", "21.0.512")
+
+        if force:
+            assert result["build"] == "512"
+            assert mock_download.call_args.kwargs["build_history"] is build_history
+
+        stages = [event["stage"] for event in build_history.get_events("21.0.512")]
+
+        # A tag found in the registry is remembered for next time, unless the history already has it.
+        assert stages == ([history.PUSHED] if pushed else []) + [history.RESOLVED] + (
+            [history.PUSHED] if tag_exists and not pushed else []
+        )
+
+        assert build_history.get_events("21.0.512")[-1 if pushed else 0]["duration"] is not None
+
+    finally:
+        build_history.close()
+
+
+@pytest.mark.parametrize(
+    "mirror_url,mirror_succeeds,mirror_store,already_downloaded",
+    (
+        (None, False, None, False),
+        ("http://mirror", True, None, False),
+        ("http://mirror", False, "store", False),
+        (None, False, "store", True),
+    ),
+)
+def test_download_product(
+    mocker: MockerFixture,
+    tmp_path: pathlib.Path,
+    mirror_url: str | None,
+    mirror_succeeds: bool,
+    mirror_store: str | None,
+    already_downloaded: bool,
+) -> None:
     """Test hython_docker_image_builder.build.download_product()."""
     build = {
         "download_url": "https://some/url",
@@ -173,15 +367,31 @@ def test_download_product(mocker: MockerFixture) -> None:
     mock_service = mocker.patch("hython_docker_image_builder.builder.sidefx.service")
     mock_service.download.get_daily_build_download.return_value = build
 
-    mock_download = mocker.patch("hython_docker_image_builder.builder._download_file")
+    def fake_download(*args: str | pathlib.Path) -> bool:
+        pathlib.Path(args[-1]).write_bytes(b"data")
+        return mirror_succeeds
+
+    mock_download = mocker.patch(
+        "hython_docker_image_builder.builder.download.download_file", side_effect=fake_download
+    )
     mock_verify = mocker.patch("hython_docker_image_builder.builder._verify_checksum")
+    mock_from_mirror = mocker.patch(
+        "hython_docker_image_builder.builder._download_from_mirror", side_effect=fake_download
+    )
+    mocker.patch("hython_docker_image_builder.builder._is_downloaded", return_value=already_downloaded)
+    mock_add = mocker.patch("hython_docker_image_builder.builder.mirror.add_to_store")
 
     release = {"version": "20.0", "build": "724"}
+    store = pathlib.Path(mirror_store) if mirror_store is not None else None
 
-    mock_target = mocker.MagicMock(spec=pathlib.Path)
-    result = builder.download_product(mock_service, release, "houdini", mock_target)
+    result = builder.download_product(
+        mock_service, release, "houdini", tmp_path, mirror_url=mirror_url, mirror_store=store
+    )
+
+    target = tmp_path / build["filename"]
+    partial = tmp_path / f".{build['filename']}.{os.getpid()}.part"
 
-    assert result == mock_target / build["filename"]
+    assert result == target
 
     mock_service.download.get_daily_build_download.assert_called_with(
         product="houdini",
@@ -189,8 +399,96 @@ def test_download_product(mocker: MockerFixture) -> None:
         build="724",
         platform="linux_x86_64",
     )
-    mock_download.assert_called_with(build["download_url"], mock_target / build["filename"])
-    mock_verify.assert_called_with(mock_target / build["filename"], build["hash"])
+
+    if already_downloaded:
+        mock_from_mirror.assert_not_called()
+        mock_download.assert_not_called()
+
+    else:
+        assert target.read_bytes() == b"data"
+
+    if mirror_url is not None:
+        mock_from_mirror.assert_called_with(mirror_url, build["hash"], partial)
+
+    else:
+        mock_from_mirror.assert_not_called()
+
+    if mirror_succeeds or already_downloaded:
+        mock_download.assert_not_called()
+
+    else:
+        mock_download.assert_called_with(build["download_url"], partial)
+        mock_verify.assert_called_with(partial, build["hash"])
+
+    if store is not None:
+        mock_add.assert_called_with(store, target, build["hash"])
+
+    else:
+        mock_add.assert_not_called()
+
+    # Only the lock file should be left behind.
+    assert not partial.exists()
+
+
+def test_download_product__history(mocker: MockerFixture, tmp_path: pathlib.Path) -> None:
+    """Test hython_docker_image_builder.build.download_product() recording downloads to a build history."""
+    content = b"installer"
+
+    mock_service = mocker.MagicMock()
+    mock_service.download.get_daily_build_download.return_value = {
+        "download_url": "https://some/url",
+        "filename": "installer.iso",
+        "hash": hashlib.md5(content).hexdigest(),
+    }
+
+    mock_download = mocker.patch(
+        "hython_docker_image_builder.builder.download.download_file",
+        side_effect=lambda _, path: path.write_bytes(content),
+    )
+    mock_verify = mocker.spy(builder, "_verify_checksum")
+
+    build_history = history.BuildHistory(tmp_path / "history.sqlite")
+    release = {"version": "21.0", "build": "512"}
+
+    try:
+        for _ in range(2):
+            builder.download_product(mock_service, release, "launcher-iso", tmp_path, build_history=build_history)
+
+        (event,) = build_history.get_events("21.0.512")
+
+    finally:
+        build_history.close()
+
+    # The second call reuses the first download without hashing it again.
+    mock_download.assert_called_once()
+    mock_verify.assert_called_once()
+
+    assert event["stage"] == history.DOWNLOADED
+    assert event["product"] == "launcher-iso"
+    assert event["hash"] == hashlib.md5(content).hexdigest()
+    assert event["size"] == len(content)
+    assert event["duration"] >= 0
+
+
+def test_download_product__bad_checksum(mocker: MockerFixture, tmp_path: pathlib.Path) -> None:
+    """Test hython_docker_image_builder.build.download_product() when the download can't be verified."""
+    mock_service = mocker.MagicMock()
+    mock_service.download.get_daily_build_download.return_value = {
+        "download_url": "https://some/url",
+        "filename": "installer.iso",
+        "hash": "b9968530277a07bb50ce0690c0c5bbcd",
+    }
+
+    mocker.patch(
+        "hython_docker_image_builder.builder.download.download_file",
+        side_effect=lambda _, path: path.write_bytes(b"bad"),
+    )
+
+    with pytest.raises(RuntimeError, match="does not match"):
+        builder.download_product(mock_service, {"version": "21.0", "build": "512"}, "launcher-iso", tmp_path)
+
+    # Neither the target nor the partial download should be left behind.
+    assert [path.name for path in tmp_path.iterdir()] == [".installer.iso.lock"]
 
 
 def test_get_service(mocker: MockerFixture) -> None:
@@ -232,7 +530,7 @@ def test_get_target_release(mocker: MockerFixture, has_releases: bool, has_build
     mock_major_minor = mocker.MagicMock(spec=str)
     build = "123" if has_build else None
 
-    mocker.patch("hython_docker_image_builder.builder._determine_version_info", return_value=(mock_major_minor, build))
+    mocker.patch("hython_docker_image_builder.builder.determine_version_info", return_value=(mock_major_minor, build))
 
     mock_get_release = mocker.patch("hython_docker_image_builder.builder._determine_release")
 
@@ -246,3 +544,104 @@ def test_get_target_release(mocker: MockerFixture, has_releases: bool, has_build
         mock_service.download.get_daily_builds_list.assert_called_with(
             product="houdini", version=mock_major_minor, platform="linux", only_production=not has_build
         )
+
+
+@pytest.mark.parametrize(
+    "version_arg,expected,expected_read",
+    (
+        ("", "3", 4),
+        ("20.0", "2", 4),
+        ("20.0.2", "2", 2),
+        ("21.0", None, 4),
+    ),
+)
+def test_get_target_release__stream(
+    mocker: MockerFixture, version_arg: str, expected: str | None, expected_read: int
+) -> None:
+    """Test hython_docker_image_builder.build.get_target_release() when streaming the releases listing."""
+    releases = [
+        {"build": "1", "date": "2024/10/26", "version": "20.0"},
+        {"build": "2", "date": "2024/10/27", "version": "20.0"},
+        {"build": "3", "date": "2024/10/28", "version": "19.5"},
+        {"build": "4", "date": "2024/09/27", "version": "20.0"},
+    ]
+
+    read = []
+    closed = []
+
+    def iter_items(**kwargs: object) -> Generator[dict]:
+        try:
+            for release in releases:
+                read.append(release)
+                yield release
+
+        finally:
+            closed.append(True)
+
+    mock_service = mocker.MagicMock()
+    mock_service.download.get_daily_builds_list.iter_items.side_effect = iter_items
+
+    context = pytest.raises(RuntimeError) if expected is None else nullcontext()
+
+    with context:
+        result = builder.get_target_release(mock_service, version_arg, stream=True)
+
+        assert result["build"] == expected
+
+    # A specific build is chosen as soon as it is seen, and the listing is always closed.
+    assert len(read) == expected_read
+    assert closed == [True]
+
+
+def _download_in_process(service: object, target_folder: pathlib.Path) -> None:
+    """Download a product, as a separate process would."""
+    builder.download_product(service, {"version": "21.0", "build": "512"}, "launcher-iso", target_folder)
+
+
+def _crash_while_downloading(target: pathlib.Path) -> None:
+    """Die part way through a download, while holding the download lock."""
+    with builder._download_lock(target):
+        target.with_name(f".{target.name}.{os.getpid()}.part").write_bytes(b"partial")
+        os._exit(1)
+
+
+def test_download_product__concurrent(mocker: MockerFixture, stub_server: Callable, tmp_path: pathlib.Path) -> None:
+    """Test that concurrent processes downloading the same product only download it once."""
+    content = bytes(range(256)) * 4096
+
+    # Serve the installer slowly, so the processes overlap.
+    stub = stub_server({"body": content, "write_size": len(content) // 4, "write_delay": 0.1})
+    url = stub.url
+
+    mock_service = mocker.MagicMock()
+    mock_service.download.get_daily_build_download.return_value = {
+        "download_url": f"{url}/installer.iso",
+        "filename": "installer.iso",
+        "hash": hashlib.md5(content).hexdigest(),
+    }
+
+    target = tmp_path / "installer.iso"
+    context = multiprocessing.get_context("fork")
+
+    # A process which crashed mid download leaves its partial file behind, but not the lock.
+    crashed = context.Process(target=_crash_while_downloading, args=(target,))
+    crashed.start()
+    crashed.join()
+
+    assert crashed.exitcode == 1
+    assert list(tmp_path.glob("*.part"))
+
+    processes = [context.Process(target=_download_in_process, args=(mock_service, tmp_path)) for _ in range(4)]
+
+    for process in processes:
+        process.start()
+
+    for process in processes:
+        process.join()
+
+    assert [process.exitcode for process in processes] == [0, 0, 0, 0]
+
+    # Only the first process to get the lock downloaded the file, the others reused it.
+    assert [request.path for request in stub.requests] == ["/installer.iso"]
+    assert target.read_bytes() == content
+    assert not list(tmp_path.glob("*.part"))
@@ -4,16 +4,25 @@
 from __future__ import annotations
 
 # Standard Library
+import base64
+import hashlib
+import http.server
+import json
+import re
 import subprocess
-from typing import TYPE_CHECKING
+import urllib.parse
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, ClassVar
 
 # Third Party
 import pytest
 
 # hython_docker_image_builder
-from hython_docker_image_builder import docker
+from hython_docker_image_builder import docker, download
 
 if TYPE_CHECKING:
+    from collections.abc import Callable
+
     from pytest_mock import MockerFixture
     from pytest_subprocess.fake_process import FakeProcess
 
@@ -41,3 +50,264 @@ def test_check_tag_exists(mocker: MockerFixture, fp: FakeProcess, exists: bool)
     result = docker.check_tag_exists("name", "version")
 
     assert result == exists
+
+
+# Registry stand-in
+
+
+def _digest(content: bytes) -> str:
+    """Compute the registry digest of some content."""
+    return f"sha256:{hashlib.sha256(content).hexdigest()}"
+
+
+class _RegistryHandler(http.server.BaseHTTPRequestHandler):
+    """A minimal in-memory stand-in for a registry which requires bearer authentication."""
+
+    protocol_version = "HTTP/1.1"
+
+    token = "secret-token"
+
+    # {(repository, reference): (content, media_type)}
+    manifests: ClassVar[dict] = {}
+    # {(repository, digest)}
+    blobs: ClassVar[set] = set()
+    # Every authenticated request made as (method, path)
+    requests: ClassVar[list] = []
+    token_requests: ClassVar[list] = []
+
+    def _send(self, status: int, body: bytes = b"", headers: dict | None = None) -> None:
+        """Send a response."""
+        self.send_response(status)
+
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _handle(self) -> None:
+        """Handle a registry request."""
+        url = urllib.parse.urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        if url.path == "/token":
+            self.token_requests.append((self.headers.get("Authorization"), urllib.parse.parse_qs(url.query)))
+            self._send(http.HTTPStatus.OK, json.dumps({"token": self.token}).encode())
+            return
+
+        if self.headers.get("Authorization") != f"Bearer {self.token}":
+            challenge = f'Bearer realm="http://{self.headers["Host"]}/token",service="stand-in"'
+            self._send(http.HTTPStatus.UNAUTHORIZED, headers={"WWW-Authenticate": challenge})
+            return
+
+        self.requests.append((self.command, url.path))
+
+        match = re.match(r"^/v2/(.+)/(manifests|blobs)/(.*)$", url.path)
+        repository, kind, reference = match.groups()  # ty: ignore[possibly-missing-attribute]
+
+        if kind == "manifests" and self.command == "GET":
+            if (repository, reference) not in self.manifests:
+                self._send(http.HTTPStatus.NOT_FOUND)
+                return
+
+            content, media_type = self.manifests[repository, reference]
+            self._send(http.HTTPStatus.OK, content, {"Content-Type": media_type})
+
+        elif kind == "manifests":
+            self.manifests[repository, reference] = (body, self.headers["Content-Type"])
+            self._send(http.HTTPStatus.CREATED, headers={"Docker-Content-Digest": _digest(body)})
+
+        elif self.command == "HEAD":
+            self._send(http.HTTPStatus.OK if (repository, reference) in self.blobs else http.HTTPStatus.NOT_FOUND)
+
+        else:
+            query = dict(urllib.parse.parse_qsl(url.query))
+
+            if (query["from"], query["mount"]) in self.blobs:
+                self.blobs.add((repository, query["mount"]))
+                self._send(http.HTTPStatus.CREATED)
+
+            else:
+                self._send(http.HTTPStatus.ACCEPTED)
+
+    do_GET = do_HEAD = do_PUT = do_POST = _handle
+
+    def log_message(self, *args: object) -> None:
+        """Silence request logging."""
+
+
+@pytest.fixture
+def registry(local_http_server: Callable) -> tuple[str, type[_RegistryHandler]]:
+    """Start a registry stand-in populated with a multi-platform image."""
+    _RegistryHandler.manifests = {}
+    _RegistryHandler.blobs = set()
+    _RegistryHandler.requests = []
+    _RegistryHandler.token_requests = []
+
+    image_manifest = json.dumps({
+        "mediaType": "application/vnd.oci.image.manifest.v1+json",
+        "config": {"digest": "sha256:config"},
+        "layers": [{"digest": "sha256:layer1"}, {"digest": "sha256:layer2"}],
+    }).encode()
+
+    index = json.dumps({
+        "mediaType": "application/vnd.oci.image.index.v1+json",
+        "manifests": [{"digest": _digest(image_manifest)}],
+    }).encode()
+
+    _RegistryHandler.manifests["name/repo", _digest(image_manifest)] = (
+        image_manifest,
+        "application/vnd.oci.image.manifest.v1+json",
+    )
+    _RegistryHandler.manifests["name/repo", "21.0.512"] = (index, "application/vnd.oci.image.index.v1+json")
+    _RegistryHandler.blobs.update({("name/repo", "sha256:config"), ("name/repo", "sha256:layer1")})
+    _RegistryHandler.blobs.update({("name/repo", "sha256:layer2"), ("other/repo", "sha256:layer1")})
+
+    return local_http_server(_RegistryHandler), _RegistryHandler
+
+
+class TestRegistryClient:
+    """Test hython_docker_image_builder.docker.RegistryClient."""
+
+    def test_copy_manifest__same_repository(self, registry: tuple[str, type[_RegistryHandler]]) -> None:
+        """Test hython_docker_image_builder.docker.RegistryClient.copy_manifest() within a repository."""
+        url, handler = registry
+        client = docker.RegistryClient(url, "user", "password")
+
+        result = client.copy_manifest("name/repo", "21.0.512", "name/repo", "21.0")
+
+        assert handler.manifests["name/repo", "21.0"] == handler.manifests["name/repo", "21.0.512"]
+        assert result == _digest(handler.manifests["name/repo", "21.0"][0])
+
+        # Only the manifest itself should have been fetched and stored, without touching any blobs.
+        assert {method for method, _ in handler.requests} == {"GET", "PUT"}
+
+        authorization, query = handler.token_requests[0]
+
+        assert authorization == f"Basic {base64.b64encode(b'user:password').decode()}"
+        assert query == {"service": ["stand-in"], "scope": ["repository:name/repo:pull"]}
+
+    def test_copy_manifest__other_repository(self, registry: tuple[str, type[_RegistryHandler]]) -> None:
+        """Test hython_docker_image_builder.docker.RegistryClient.copy_manifest() between repositories."""
+        url, handler = registry
+        client = docker.RegistryClient(url)
+
+        client.copy_manifest("name/repo", "21.0.512", "other/repo", "21.0.512")
+
+        assert handler.manifests["other/repo", "21.0.512"] == handler.manifests["name/repo", "21.0.512"]
+        assert {blob for repository, blob in handler.blobs if repository == "other/repo"} == {
+            "sha256:config",
+            "sha256:layer1",
+            "sha256:layer2",
+        }
+
+        # The blob which already existed should not have been mounted.
+        mounts = [path for method, path in handler.requests if method == "POST"]
+        assert len(mounts) == 2
+
+        # Tokens are cached per scope.
+        assert len(handler.token_requests) == 4
+        assert handler.token_requests[0][0] is None
+
+    def test_get_manifest__missing(self, registry: tuple[str, type[_RegistryHandler]]) -> None:
+        """Test hython_docker_image_builder.docker.RegistryClient.get_manifest() when the manifest doesn't exist."""
+        url, _ = registry
+
+        with pytest.raises(RuntimeError, match="Returned code 404"):
+            docker.RegistryClient(url).get_manifest("name/repo", "missing")
+
+    def test_mount_blob__not_mounted(self, registry: tuple[str, type[_RegistryHandler]]) -> None:
+        """Test hython_docker_image_builder.docker.RegistryClient.mount_blob() when the blob cannot be mounted."""
+        url, _ = registry
+
+        with pytest.raises(RuntimeError, match="Could not mount"):
+            docker.RegistryClient(url).mount_blob("other/repo", "sha256:missing", "name/repo")
+
+    def test_put_manifest__failed(self, mocker: MockerFixture) -> None:
+        """Test hython_docker_image_builder.docker.RegistryClient.put_manifest() when the manifest is rejected."""
+        client = docker.RegistryClient()
+        mock_request = mocker.patch.object(client._session, "request")
+        mock_request.return_value.status_code = http.HTTPStatus.BAD_REQUEST
+
+        with pytest.raises(RuntimeError, match="Could not put manifest"):
+            client.put_manifest("name/repo", "21.0", b"{}", "application/vnd.oci.image.index.v1+json")
+
+        mock_request.assert_called_once_with(
+            "PUT",
+            f"{docker.REGISTRY_URL}/v2/name/repo/manifests/21.0",
+            headers={"Content-Type": "application/vnd.oci.image.index.v1+json"},
+            params=None,
+            data=b"{}",
+            timeout=(download.DEFAULT_CONNECT_TIMEOUT, download.DEFAULT_READ_TIMEOUT),
+        )
+
+    @pytest.mark.parametrize(
+        "challenge,status,payload,expected",
+        (
+            ("Basic realm=registry", http.HTTPStatus.OK, {}, None),
+            ('Bearer realm="https://auth/token"', http.HTTPStatus.FORBIDDEN, {}, None),
+            ('Bearer realm="https://auth/token"', http.HTTPStatus.OK, {"token": "abc"}, "abc"),
+            ('Bearer realm="https://auth/token"', http.HTTPStatus.OK, {"access_token": "def"}, "def"),
+        ),
+    )
+    def test__fetch_token(
+        self, mocker: MockerFixture, challenge: str, status: int, payload: dict, expected: str | None
+    ) -> None:
+        """Test hython_docker_image_builder.docker.RegistryClient._fetch_token()."""
+        client = docker.RegistryClient(connect_timeout=1, read_timeout=2)
+        mock_get = mocker.patch.object(client._session, "get")
+        mock_get.return_value.status_code = status
+        mock_get.return_value.json.return_value = payload
+
+        context = pytest.raises(RuntimeError) if expected is None else nullcontext()
+
+        with context:
+            assert client._fetch_token(challenge, ("repository:name/repo:pull",)) == expected
+
+            mock_get.assert_called_with(
+                "https://auth/token",
+                params={"service": "", "scope": ["repository:name/repo:pull"]},
+                auth=None,
+                timeout=(1, 2),
+            )
+
+
+@pytest.mark.parametrize(
+    "challenge,expected",
+    (
+        ("", {}),
+        ('Basic realm="registry"', {}),
+        (
+            'Bearer realm="https://auth/token",service="registry",scope="a:b:pull"',
+            {
+                "realm": "https://auth/token",
+                "service": "registry",
+                "scope": "a:b:pull",
+            },
+        ),
+    ),
+)
+def test__parse_bearer_challenge(challenge: str, expected: dict) -> None:
+    """Test hython_docker_image_builder.docker._parse_bearer_challenge()."""
+    assert docker._parse_bearer_challenge(challenge) == expected
+
+
+@pytest.mark.parametrize("tag_base,expected", (("name/repo", "name/repo"), ("ubuntu", "library/ubuntu")))
+def test_get_repository_name(tag_base: str, expected: str) -> None:
+    """Test hython_docker_image_builder.docker.get_repository_name()."""
+    assert docker.get_repository_name(tag_base) == expected
+
+
+@pytest.mark.parametrize("target_tag_base,expected_repository", ((None, "name/repo"), ("other/repo", "other/repo")))
+def test_promote_tag(mocker: MockerFixture, target_tag_base: str | None, expected_repository: str) -> None:
+    """Test hython_docker_image_builder.docker.promote_tag()."""
+    mock_client = mocker.MagicMock(spec=docker.RegistryClient)
+
+    result = docker.promote_tag(mock_client, "name/repo", "21.0.512", "21.0", target_tag_base)
+
+    assert result == mock_client.copy_manifest.return_value
+
+    mock_client.copy_manifest.assert_called_with("name/repo", "21.0.512", expected_repository, "21.0")
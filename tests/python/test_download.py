@@ -0,0 +1,390 @@
+"""Test the hython_docker_image_builder.download module."""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import http
+import http.server
+import re
+import threading
+from typing import TYPE_CHECKING
+
+# Third Party
+import pytest
+
+# hython_docker_image_builder
+from hython_docker_image_builder import download
+
+if TYPE_CHECKING:
+    import pathlib
+    from collections.abc import Callable
+
+    from pytest_mock import MockerFixture
+
+# Globals
+CONTENT = bytes(range(256)) * 256
+
+# Short limits so injected faults are noticed quickly.
+FAST_LIMITS = {"read_timeout": 0.5, "min_throughput": 1024**2, "stall_window": 0.2}
+
+
+class FakeClock:
+    """A clock which only moves when told to."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        """Get the current time."""
+        return self.now
+
+
+class FaultInjectingHandler(http.server.BaseHTTPRequestHandler):
+    """Serve CONTENT, supporting ranges, with a fault injected into each request.
+
+    Subclasses set the faults to inject, the last of which is repeated, and the list
+    which the Range header of each request is appended to.
+    """
+
+    faults: list
+    requests_seen: list
+    lock: threading.Lock
+
+    protocol_version = "HTTP/1.1"
+
+    def _send_headers(self, status: int, body: bytes, headers: dict | None = None) -> None:
+        """Send the response headers for a body."""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        self.end_headers()
+
+    def _write_body(self, fault: str, body: bytes) -> None:
+        """Write the response body, with any fault."""
+        if fault == "disconnect":
+            self.wfile.write(body[: len(body) // 2])
+            self.close_connection = True
+
+        elif fault == "stall":
+            self.wfile.write(body[: len(body) // 2])
+            self.wfile.flush()
+            threading.Event().wait(2)
+            self.close_connection = True
+
+        elif fault == "trickle":
+            for start in range(0, len(body), 64):
+                self.wfile.write(body[start : start + 64])
+                self.wfile.flush()
+                threading.Event().wait(0.01)
+
+        else:
+            self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        """Respond to a download request."""
+        with self.lock:
+            fault = self.faults[min(len(self.requests_seen), len(self.faults) - 1)]
+            self.requests_seen.append(self.headers.get("Range"))
+
+        if isinstance(fault, int):
+            retry_after = "3" if fault == http.HTTPStatus.TOO_MANY_REQUESTS else None
+            self._send_headers(fault, b"", {"Retry-After": retry_after} if retry_after else None)
+            return
+
+        match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range") or "")
+
+        if fault == "not_satisfiable" and match:
+            self._send_headers(http.HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, b"")
+            return
+
+        if match and fault != "ignore_range":
+            offset = int(match.group(1))
+            body = CONTENT[offset:]
+            content_range = f"bytes {offset}-{len(CONTENT) - 1}/{len(CONTENT)}"
+            self._send_headers(http.HTTPStatus.PARTIAL_CONTENT, body, {"Content-Range": content_range})
+
+        else:
+            body = CONTENT
+            self._send_headers(http.HTTPStatus.OK, body)
+
+        try:
+            self._write_body(fault, body)
+
+        # The client hung up on a stalled response.
+        except OSError:
+            self.close_connection = True
+
+    def log_message(self, *args: object) -> None:
+        """Silence request logging."""
+
+
+def _make_handler(faults: list, requests_seen: list) -> type[FaultInjectingHandler]:
+    """Build a request handler which injects faults.
+
+    Args:
+        faults: The fault to inject into each successive request, the last being repeated.
+        requests_seen: A list which the Range header of each request is appended to.
+
+    Returns:
+        The request handler class.
+    """
+    return type(
+        "StubDownloadHandler",
+        (FaultInjectingHandler,),
+        {"faults": faults, "requests_seen": requests_seen, "lock": threading.Lock()},
+    )
+
+
+# Tests
+
+
+class TestCircuitBreaker:
+    """Test hython_docker_image_builder.download.CircuitBreaker."""
+
+    def test_open(self) -> None:
+        """Test that the breaker opens after consecutive failures, and allows a trial after the reset timeout."""
+        clock = FakeClock()
+        breaker = download.CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+
+        breaker.record_failure()
+        assert breaker.allow()
+
+        breaker.record_failure()
+        assert not breaker.allow()
+
+        clock.now = 10
+        assert breaker.allow()
+
+        # A failed trial opens the breaker again straight away.
+        breaker.record_failure()
+        assert not breaker.allow()
+
+        clock.now = 20
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.allow()
+
+    def test_record_success(self) -> None:
+        """Test that a success resets the count of consecutive failures."""
+        breaker = download.CircuitBreaker(failure_threshold=2)
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.allow()
+
+
+class TestThroughputMonitor:
+    """Test hython_docker_image_builder.download._ThroughputMonitor."""
+
+    def test_update(self) -> None:
+        """Test that throughput is measured over successive windows."""
+        clock = FakeClock()
+        monitor = download._ThroughputMonitor(100, 10, clock)
+
+        # Nothing is checked until a full window has passed.
+        clock.now = 9
+        monitor.update(0)
+
+        clock.now = 10
+        monitor.update(1000)
+
+        # The previous window's data doesn't count towards the next one.
+        clock.now = 20
+        monitor.update(1000)
+
+        clock.now = 30
+
+        with pytest.raises(download._RetryableError, match="stalled at 10 bytes/s"):
+            monitor.update(100)
+
+
+@pytest.mark.parametrize(
+    "attempt,retry_after,low,high",
+    (
+        (1, None, 0, 2),
+        (3, None, 0, 8),
+        (10, None, 0, 30),
+        (1, 45.0, 45, 45),
+    ),
+)
+def test__get_backoff_delay(attempt: int, retry_after: float | None, low: float, high: float) -> None:
+    """Test hython_docker_image_builder.download._get_backoff_delay()."""
+    delays = [download._get_backoff_delay(attempt, 2, 30, retry_after) for _ in range(50)]
+
+    assert all(low <= delay <= high for delay in delays)
+
+    # The delays are jittered.
+    if retry_after is None:
+        assert len(set(delays)) > 1
+
+
+@pytest.mark.parametrize(
+    "faults,expected_ranges",
+    (
+        (["ok"], [None]),
+        ([http.HTTPStatus.SERVICE_UNAVAILABLE, "ok"], [None, None]),
+        (["disconnect", "ok"], [None, f"bytes={len(CONTENT) // 2}-"]),
+        (["stall", "ok"], [None, f"bytes={len(CONTENT) // 2}-"]),
+        (["disconnect", "ignore_range"], [None, f"bytes={len(CONTENT) // 2}-"]),
+        (["disconnect", "not_satisfiable", "ok"], [None, f"bytes={len(CONTENT) // 2}-", None]),
+    ),
+)
+def test_download_file(
+    mocker: MockerFixture,
+    local_http_server: Callable,
+    tmp_path: pathlib.Path,
+    faults: list,
+    expected_ranges: list,
+) -> None:
+    """Test hython_docker_image_builder.download.download_file() recovering from injected faults."""
+    mock_sleep = mocker.patch("hython_docker_image_builder.download.time.sleep")
+
+    requests_seen: list = []
+    url = local_http_server(_make_handler(faults, requests_seen))
+    target = tmp_path / "installer.iso"
+
+    breaker = download.CircuitBreaker()
+
+    download.download_file(f"{url}/installer.iso", target, circuit_breaker=breaker, **FAST_LIMITS)
+
+    assert target.read_bytes() == CONTENT
+    assert requests_seen == expected_ranges
+    assert mock_sleep.call_count == len(expected_ranges) - 1
+    assert breaker.allow()
+
+
+def test_download_file__trickle(mocker: MockerFixture, local_http_server: Callable, tmp_path: pathlib.Path) -> None:
+    """Test hython_docker_image_builder.download.download_file() abandoning a download that is too slow."""
+    mocker.patch("hython_docker_image_builder.download.time.sleep")
+
+    requests_seen: list = []
+    url = local_http_server(_make_handler(["trickle", "ok"], requests_seen))
+    target = tmp_path / "installer.iso"
+
+    download.download_file(f"{url}/installer.iso", target, circuit_breaker=download.CircuitBreaker(), **FAST_LIMITS)
+
+    assert target.read_bytes() == CONTENT
+
+    # The trickle was abandoned part way through, and the rest was resumed.
+    assert requests_seen[0] is None
+    assert 0 < int(requests_seen[1].removeprefix("bytes=").rstrip("-")) < len(CONTENT)
+
+
+def test_download_file__retry_after(mocker: MockerFixture, local_http_server: Callable, tmp_path: pathlib.Path) -> None:
+    """Test hython_docker_image_builder.download.download_file() waiting as long as the server asks."""
+    mock_sleep = mocker.patch("hython_docker_image_builder.download.time.sleep")
+
+    url = local_http_server(_make_handler([http.HTTPStatus.TOO_MANY_REQUESTS, "ok"], []))
+
+    download.download_file(
+        f"{url}/installer.iso", tmp_path / "installer.iso", backoff_base=1, circuit_breaker=download.CircuitBreaker()
+    )
+
+    mock_sleep.assert_called_once_with(3.0)
+
+
+def test_download_file__not_found(mocker: MockerFixture, local_http_server: Callable, tmp_path: pathlib.Path) -> None:
+    """Test hython_docker_image_builder.download.download_file() not retrying errors which won't go away."""
+    mock_sleep = mocker.patch("hython_docker_image_builder.download.time.sleep")
+
+    requests_seen: list = []
+    url = local_http_server(_make_handler([http.HTTPStatus.NOT_FOUND], requests_seen))
+
+    with pytest.raises(RuntimeError, match="Returned code 404"):
+        download.download_file(
+            f"{url}/installer.iso", tmp_path / "installer.iso", circuit_breaker=download.CircuitBreaker()
+        )
+
+    assert len(requests_seen) == 1
+    mock_sleep.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "max_attempts,retry_budget,expected_attempts",
+    ((3, 3600, 3), (10, 0, 1), (download.DEFAULT_MAX_ATTEMPTS, 3600, download.DEFAULT_MAX_ATTEMPTS)),
+)
+def test_download_file__exhausted(
+    mocker: MockerFixture,
+    local_http_server: Callable,
+    tmp_path: pathlib.Path,
+    max_attempts: int,
+    retry_budget: float,
+    expected_attempts: int,
+) -> None:
+    """Test hython_docker_image_builder.download.download_file() giving up once out of attempts or time."""
+    mock_sleep = mocker.patch("hython_docker_image_builder.download.time.sleep")
+
+    requests_seen: list = []
+    url = local_http_server(_make_handler([http.HTTPStatus.BAD_GATEWAY], requests_seen))
+
+    # A single download's retries shouldn't open the breaker before they run out.
+    breaker = download.CircuitBreaker()
+
+    with pytest.raises(RuntimeError, match=f"after {expected_attempts} attempts: Returned code 502"):
+        download.download_file(
+            f"{url}/installer.iso",
+            tmp_path / "installer.iso",
+            max_attempts=max_attempts,
+            retry_budget=retry_budget,
+            circuit_breaker=breaker,
+        )
+
+    assert len(requests_seen) == expected_attempts
+    assert mock_sleep.call_count == expected_attempts - 1
+    assert breaker.allow()
+
+
+@pytest.mark.parametrize("url", ("installer.iso", "http://", "ftp://example.com/installer.iso"))
+def test_download_file__invalid_url(mocker: MockerFixture, tmp_path: pathlib.Path, url: str) -> None:
+    """Test hython_docker_image_builder.download.download_file() not retrying requests which can never succeed."""
+    mock_sleep = mocker.patch("hython_docker_image_builder.download.time.sleep")
+
+    breaker = download.CircuitBreaker(failure_threshold=1)
+
+    with pytest.raises(RuntimeError, match="Error downloading file: "):
+        download.download_file(url, tmp_path / "installer.iso", circuit_breaker=breaker)
+
+    mock_sleep.assert_not_called()
+    assert breaker.allow()
+
+
+def test_download_file__circuit_open(
+    mocker: MockerFixture, local_http_server: Callable, tmp_path: pathlib.Path
+) -> None:
+    """Test hython_docker_image_builder.download.download_file() failing fast once the host is clearly down."""
+    mocker.patch("hython_docker_image_builder.download.time.sleep")
+
+    requests_seen: list = []
+    url = local_http_server(_make_handler([http.HTTPStatus.SERVICE_UNAVAILABLE], requests_seen))
+
+    breaker = download.CircuitBreaker(failure_threshold=2)
+
+    # Each download which runs out of retries counts as one failure.
+    for name in ("installer.iso", "installer.tar.gz"):
+        with pytest.raises(RuntimeError, match="after 3 attempts"):
+            download.download_file(f"{url}/{name}", tmp_path / name, max_attempts=3, circuit_breaker=breaker)
+
+    assert len(requests_seen) == 6
+
+    # Other downloads from the same host don't even try.
+    with pytest.raises(RuntimeError, match="has failed too many times recently"):
+        download.download_file(f"{url}/launcher.tar.gz", tmp_path / "launcher.tar.gz", circuit_breaker=breaker)
+
+    assert len(requests_seen) == 6
+
+
+def test_get_circuit_breaker(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test hython_docker_image_builder.download.get_circuit_breaker()."""
+    monkeypatch.setattr(download, "_circuit_breakers", {})
+
+    breaker = download.get_circuit_breaker("https://cdn.example.com/a.iso")
+
+    assert download.get_circuit_breaker("https://cdn.example.com/b.iso") is breaker
+    assert download.get_circuit_breaker("https://mirror:8000/abc123") is not breaker
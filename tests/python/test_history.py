@@ -0,0 +1,151 @@
+"""Test the hython_docker_image_builder.history module."""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import os
+import pathlib
+from typing import TYPE_CHECKING
+
+# Third Party
+import pytest
+
+# hython_docker_image_builder
+from hython_docker_image_builder import history
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+
+@pytest.fixture
+def build_history(tmp_path: pathlib.Path) -> Generator[history.BuildHistory]:
+    """Open a build history in a temporary directory."""
+    result = history.BuildHistory(tmp_path / "db" / "history.sqlite")
+
+    yield result
+
+    result.close()
+
+
+# Tests
+
+
+class TestBuildHistory:
+    """Test hython_docker_image_builder.history.BuildHistory."""
+
+    def test_shared(self, build_history: history.BuildHistory) -> None:
+        """Test that the history is persisted and can be opened by more than one connection at once."""
+        build_history.record(history.RESOLVED, "21.0.512", duration=0.5)
+
+        other = history.BuildHistory(build_history.path)
+
+        try:
+            other.record(history.DOWNLOADED, "21.0.512", product="launcher-iso")
+
+        finally:
+            other.close()
+
+        assert [event["stage"] for event in build_history.get_events()] == [history.RESOLVED, history.DOWNLOADED]
+
+    def test_find_pushed(self, build_history: history.BuildHistory) -> None:
+        """Test hython_docker_image_builder.history.BuildHistory.find_pushed()."""
+        build_history.record(history.BUILT, "21.0.512", tag_base="name/repo", digest="sha256:built")
+
+        assert build_history.find_pushed("name/repo", "21.0.512") is None
+
+        build_history.record(history.PUSHED, "21.0.512", tag_base="name/repo", digest="sha256:first")
+        build_history.record(history.PUSHED, "21.0.512", tag_base="name/repo", digest="sha256:second")
+        build_history.record(history.PUSHED, "21.0.512", tag_base="other/repo", digest="sha256:other")
+
+        result = build_history.find_pushed("name/repo", "21.0.512")
+
+        assert result is not None
+        assert result["digest"] == "sha256:second"
+        assert result["recorded_at"]
+
+        assert build_history.find_pushed("name/repo", "21.0.513") is None
+
+    def test_get_events(self, build_history: history.BuildHistory) -> None:
+        """Test hython_docker_image_builder.history.BuildHistory.get_events()."""
+        build_history.record(history.RESOLVED, "21.0.512")
+        build_history.record(
+            history.DOWNLOADED, "22.0.100", product="launcher-iso", file_hash="abc123", size=1024, duration=2.0
+        )
+
+        (event,) = build_history.get_events("22.0.100")
+
+        assert {key: value for key, value in event.items() if key not in {"id", "recorded_at"}} == {
+            "stage": history.DOWNLOADED,
+            "version": "22.0.100",
+            "tag_base": None,
+            "product": "launcher-iso",
+            "hash": "abc123",
+            "size": 1024,
+            "digest": None,
+            "duration": 2.0,
+        }
+
+        assert len(build_history.get_events()) == 2
+
+    def test_get_stage_statistics(self, build_history: history.BuildHistory) -> None:
+        """Test hython_docker_image_builder.history.BuildHistory.get_stage_statistics()."""
+        build_history.record(history.DOWNLOADED, "21.0.512", product="launcher-iso", size=3000, duration=1.0)
+        build_history.record(history.DOWNLOADED, "21.0.513", product="launcher-iso", size=1000, duration=3.0)
+        build_history.record(history.BUILT, "21.0.512", tag_base="name/repo", duration=100.0)
+        build_history.record(history.BUILT, "21.0.513", tag_base="name/repo", duration=200.0)
+
+        # Events without a duration aren't counted.
+        build_history.record(history.PUSHED, "21.0.512", tag_base="name/repo")
+
+        assert build_history.get_stage_statistics() == [
+            {
+                "stage": history.BUILT,
+                "product": None,
+                "count": 2,
+                "mean_duration": 150.0,
+                "max_duration": 200.0,
+                "bytes_per_second": None,
+            },
+            {
+                "stage": history.DOWNLOADED,
+                "product": "launcher-iso",
+                "count": 2,
+                "mean_duration": 2.0,
+                "max_duration": 3.0,
+                "bytes_per_second": 1000.0,
+            },
+        ]
+
+    def test_is_verified_file(self, build_history: history.BuildHistory, tmp_path: pathlib.Path) -> None:
+        """Test hython_docker_image_builder.history.BuildHistory.is_verified_file()."""
+        file_path = tmp_path / "installer.iso"
+
+        assert not build_history.is_verified_file(file_path, "abc123")
+
+        file_path.write_bytes(b"data")
+
+        assert not build_history.is_verified_file(file_path, "abc123")
+
+        build_history.add_verified_file(file_path, "abc123")
+
+        assert build_history.is_verified_file(file_path, "abc123")
+        assert not build_history.is_verified_file(file_path, "def456")
+
+        # Any change to the file means it needs verifying again.
+        stat = file_path.stat()
+        os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+        assert not build_history.is_verified_file(file_path, "abc123")
+
+
+@pytest.mark.parametrize("value,expected", ((None, None), ("", None), ("/data/history.sqlite", "/data/history.sqlite")))
+def test_get_default_path(monkeypatch: pytest.MonkeyPatch, value: str | None, expected: str | None) -> None:
+    """Test hython_docker_image_builder.history.get_default_path()."""
+    if value is None:
+        monkeypatch.delenv(history.HISTORY_ENV_VAR, raising=False)
+
+    else:
+        monkeypatch.setenv(history.HISTORY_ENV_VAR, value)
+
+    assert history.get_default_path() == (pathlib.Path(expected) if expected is not None else None)
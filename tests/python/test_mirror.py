@@ -0,0 +1,196 @@
+"""Test the hython_docker_image_builder.mirror module."""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import hashlib
+import http
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import TYPE_CHECKING
+
+# Third Party
+import pytest
+import requests
+
+# hython_docker_image_builder
+from hython_docker_image_builder import mirror
+
+if TYPE_CHECKING:
+    import pathlib
+    from collections.abc import Generator
+
+    from pytest_mock import MockerFixture
+
+
+# Random-ish content large enough to need several socket writes.
+CONTENT = bytes(range(256)) * 4096
+CONTENT_HASH = hashlib.md5(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def store(tmp_path: pathlib.Path) -> pathlib.Path:
+    """Create a mirror store containing a valid and a corrupted file."""
+    store_path = tmp_path / "store"
+    store_path.mkdir()
+
+    (store_path / CONTENT_HASH).write_bytes(CONTENT)
+    (store_path / ("0" * 32)).write_bytes(b"corrupted")
+
+    return store_path
+
+
+@pytest.fixture
+def mirror_url(store: pathlib.Path) -> Generator[str]:
+    """Serve the mirror store on localhost."""
+    server = mirror.build_server(store, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    yield f"http://127.0.0.1:{server.server_port}"
+
+    server.shutdown()
+    server.server_close()
+
+
+# Tests
+
+
+class TestVerifiedFiles:
+    """Test hython_docker_image_builder.mirror._VerifiedFiles."""
+
+    def test_is_verified(self, mocker: MockerFixture, store: pathlib.Path) -> None:
+        """Test hython_docker_image_builder.mirror._VerifiedFiles.is_verified()."""
+        verified_files = mirror._VerifiedFiles()
+        spy_digest = mocker.spy(hashlib, "file_digest")
+
+        assert verified_files.is_verified(store / CONTENT_HASH, CONTENT_HASH)
+        assert verified_files.is_verified(store / CONTENT_HASH, CONTENT_HASH)
+
+        # The file is only hashed once while it is unchanged.
+        assert spy_digest.call_count == 1
+
+        assert not verified_files.is_verified(store / ("0" * 32), "0" * 32)
+        assert not verified_files.is_verified(store / ("0" * 32), "0" * 32)
+
+        assert spy_digest.call_count == 3
+
+
+class TestMirrorRequestHandler:
+    """Test hython_docker_image_builder.mirror._MirrorRequestHandler."""
+
+    def test_get(self, mirror_url: str) -> None:
+        """Test getting a whole file."""
+        response = requests.get(f"{mirror_url}/{CONTENT_HASH}", timeout=5)
+
+        assert response.status_code == http.HTTPStatus.OK
+        assert response.headers["Accept-Ranges"] == "bytes"
+        assert response.content == CONTENT
+
+    @pytest.mark.parametrize(
+        "header,expected_range",
+        (
+            ("bytes=100-199", (100, 199)),
+            ("bytes=1000000-", (1000000, len(CONTENT) - 1)),
+            ("bytes=-10", (len(CONTENT) - 10, len(CONTENT) - 1)),
+        ),
+    )
+    def test_get__range(self, mirror_url: str, header: str, expected_range: tuple[int, int]) -> None:
+        """Test getting part of a file."""
+        response = requests.get(f"{mirror_url}/{CONTENT_HASH}", headers={"Range": header}, timeout=5)
+
+        start, end = expected_range
+
+        assert response.status_code == http.HTTPStatus.PARTIAL_CONTENT
+        assert response.headers["Content-Range"] == f"bytes {start}-{end}/{len(CONTENT)}"
+        assert response.content == CONTENT[start : end + 1]
+
+    def test_get__unsatisfiable_range(self, mirror_url: str) -> None:
+        """Test getting a range beyond the end of the file."""
+        response = requests.get(f"{mirror_url}/{CONTENT_HASH}", headers={"Range": "bytes=5000000-"}, timeout=5)
+
+        assert response.status_code == http.HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+        assert response.headers["Content-Range"] == f"bytes */{len(CONTENT)}"
+
+    @pytest.mark.parametrize("path", ("abc", "0" * 32, "f" * 32, f"{CONTENT_HASH}/extra"))
+    def test_get__not_found(self, mirror_url: str, path: str) -> None:
+        """Test getting invalid, unknown and corrupted files."""
+        response = requests.get(f"{mirror_url}/{path}", timeout=5)
+
+        assert response.status_code == http.HTTPStatus.NOT_FOUND
+
+    def test_head(self, mirror_url: str) -> None:
+        """Test getting only the headers for a file."""
+        response = requests.head(f"{mirror_url}/{CONTENT_HASH}", timeout=5)
+
+        assert response.status_code == http.HTTPStatus.OK
+        assert response.headers["Content-Length"] == str(len(CONTENT))
+        assert not response.content
+
+    def test_concurrent_readers(self, mirror_url: str) -> None:
+        """Test many clients reading different parts of a file at once."""
+        chunk_size = len(CONTENT) // 16
+
+        def get_chunk(index: int) -> bytes:
+            header = f"bytes={index * chunk_size}-{(index + 1) * chunk_size - 1}"
+            return requests.get(f"{mirror_url}/{CONTENT_HASH}", headers={"Range": header}, timeout=5).content
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            chunks = list(executor.map(get_chunk, range(16)))
+
+        assert b"".join(chunks) == CONTENT
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    (
+        (None, None),
+        ("bytes=0-9", (0, 9)),
+        ("bytes=90-", (90, 99)),
+        ("bytes=90-200", (90, 99)),
+        ("bytes=-10", (90, 99)),
+        ("bytes=-200", (0, 99)),
+        ("bytes=-", None),
+        ("bytes=0-1,5-6", None),
+        ("lines=0-1", None),
+        ("bytes=100-", ValueError),
+        ("bytes=9-5", ValueError),
+    ),
+)
+def test__parse_range(header: str | None, expected: tuple | type[ValueError] | None) -> None:
+    """Test hython_docker_image_builder.mirror._parse_range()."""
+    context = pytest.raises(ValueError, match="Unsatisfiable") if expected is ValueError else nullcontext()
+
+    with context:
+        assert mirror._parse_range(header, 100) == expected
+
+
+def test_add_to_store(tmp_path: pathlib.Path) -> None:
+    """Test hython_docker_image_builder.mirror.add_to_store()."""
+    source = tmp_path / "installer.iso"
+    source.write_bytes(CONTENT)
+
+    store = tmp_path / "store"
+
+    result = mirror.add_to_store(store, source, CONTENT_HASH)
+
+    assert result == store / CONTENT_HASH
+    assert result.read_bytes() == CONTENT
+    assert [path.name for path in store.iterdir()] == [CONTENT_HASH]
+
+    # Adding the same file again leaves the stored copy alone.
+    source.write_bytes(b"changed")
+
+    assert mirror.add_to_store(store, source, CONTENT_HASH) == result
+    assert result.read_bytes() == CONTENT
+
+
+def test_serve(mocker: MockerFixture, tmp_path: pathlib.Path) -> None:
+    """Test hython_docker_image_builder.mirror.serve()."""
+    mock_build = mocker.patch("hython_docker_image_builder.mirror.build_server")
+
+    mirror.serve(tmp_path, "127.0.0.1", 8000)
+
+    mock_build.assert_called_with(tmp_path, "127.0.0.1", 8000)
+    mock_build.return_value.__enter__.return_value.serve_forever.assert_called()
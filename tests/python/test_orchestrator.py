@@ -0,0 +1,319 @@
+"""Test the hython_docker_image_builder.orchestrator module."""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import pathlib
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, NamedTuple
+
+# Third Party
+import pytest
+
+# hython_docker_image_builder
+from hython_docker_image_builder import history, orchestrator
+
+if TYPE_CHECKING:
+    from pytest_mock import MockerFixture
+
+
+# A stand-in docker executable which records when each build starts and stops, and fails
+# any build of a version listed in the FAKE_DOCKER_FAIL environment variable. Successful
+# builds write a metadata file if asked to.
+FAKE_DOCKER = f"""#!{sys.executable}
+import json
+import os
+import pathlib
+import sys
+import time
+
+version = sys.argv[4].split("=")[1]
+events = pathlib.Path(os.environ["FAKE_DOCKER_EVENTS"])
+
+with events.open("a") as handle:
+    handle.write(f"start {{time.monotonic()}}\\n")
+
+print(" ".join(sys.argv[1:]), flush=True)
+time.sleep(0.2)
+print(f"built {{version}}", flush=True)
+
+with events.open("a") as handle:
+    handle.write(f"stop {{time.monotonic()}}\\n")
+
+if version in os.environ.get("FAKE_DOCKER_FAIL", ""):
+    sys.exit(1)
+
+if "--metadata-file" in sys.argv:
+    metadata = {{"containerimage.digest": f"sha256:{{version}}"}}
+    pathlib.Path(sys.argv[sys.argv.index("--metadata-file") + 1]).write_text(json.dumps(metadata))
+"""
+
+
+class _DiskUsage(NamedTuple):
+    """A stand-in for the result of shutil.disk_usage()."""
+
+    total: int
+    used: int
+    free: int
+
+
+def _build_info(version: str, build: str) -> dict:
+    """Build a fake result of builder.check_build_can_be_installed()."""
+    return {
+        "version": version,
+        "build": build,
+        "launcher_name": f"install_houdini_launcher_{version}.{build}.sh",
+        "iso_name": f"houdini-{version}.{build}-linux_x86_64_gcc11.2.iso",
+    }
+
+
+def _get_max_concurrency(events_path: pathlib.Path) -> int:
+    """Determine the most builds which were running at the same time."""
+    events = sorted(
+        (float(value), name == "start")
+        for name, value in (line.split() for line in events_path.read_text(encoding="utf-8").splitlines())
+    )
+
+    running = max_running = 0
+
+    for _, started in events:
+        running += 1 if started else -1
+        max_running = max(max_running, running)
+
+    return max_running
+
+
+@pytest.fixture
+def fake_docker(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> pathlib.Path:
+    """Create a fake docker executable."""
+    docker_path = tmp_path / "docker"
+    docker_path.write_text(FAKE_DOCKER, encoding="utf-8")
+    docker_path.chmod(0o755)
+
+    monkeypatch.setenv("FAKE_DOCKER_EVENTS", (tmp_path / "events.txt").as_posix())
+
+    return docker_path
+
+
+# Tests
+
+
+class TestResourceBudget:
+    """Test hython_docker_image_builder.orchestrator._ResourceBudget."""
+
+    def test_reserve(self) -> None:
+        """Test hython_docker_image_builder.orchestrator._ResourceBudget.reserve()."""
+        budget = orchestrator._ResourceBudget(2, 10)
+        acquired = threading.Event()
+
+        def reserve_remaining() -> None:
+            with budget.reserve(6):
+                acquired.set()
+
+        with budget.reserve(6):
+            thread = threading.Thread(target=reserve_remaining)
+            thread.start()
+
+            # There is a free job slot but not enough disk space until the first reservation is released.
+            assert not acquired.wait(0.1)
+
+        thread.join()
+
+        assert acquired.is_set()
+
+
+@pytest.mark.parametrize("cpu_count,expected", ((None, 1), (2, 1), (16, 4)))
+def test__get_default_max_jobs(mocker: MockerFixture, cpu_count: int | None, expected: int) -> None:
+    """Test hython_docker_image_builder.orchestrator._get_default_max_jobs()."""
+    mocker.patch("os.cpu_count", return_value=cpu_count)
+
+    assert orchestrator._get_default_max_jobs() == expected
+
+
+def test__get_alias_versions() -> None:
+    """Test hython_docker_image_builder.orchestrator._get_alias_versions()."""
+    builds = [
+        _build_info("21.0", "99"),
+        _build_info("21.0", "512"),
+        _build_info("21.0", "500"),
+        _build_info("22.0", "1"),
+    ]
+
+    assert orchestrator._get_alias_versions(builds) == {"21.0.512", "22.0.1"}
+
+
+def test__stream_output(mocker: MockerFixture, capsys: pytest.CaptureFixture) -> None:
+    """Test hython_docker_image_builder.orchestrator._stream_output()."""
+    mock_log = mocker.MagicMock()
+
+    orchestrator._stream_output(iter(["line 1\n", "line 2\n"]), "21.0.512", mock_log)
+
+    lines = capsys.readouterr().out.splitlines()
+
+    assert len(lines) == 2
+    assert lines[1].endswith(" [21.0.512] line 2")
+
+    mock_log.write.assert_called_with(f"{lines[1]}\n")
+
+
+@pytest.mark.parametrize(
+    "push,alias,metadata_file,expected",
+    (
+        (False, True, None, ["--tag", "name/repo:21.0", "--load"]),
+        (True, True, None, ["--tag", "name/repo:21.0", "--push"]),
+        (True, False, None, ["--push"]),
+        (
+            True,
+            True,
+            pathlib.Path("/logs/metadata.json"),
+            ["--tag", "name/repo:21.0", "--metadata-file", "/logs/metadata.json", "--push"],
+        ),
+    ),
+)
+def test_build_buildx_command(push: bool, alias: bool, metadata_file: pathlib.Path | None, expected: list[str]) -> None:
+    """Test hython_docker_image_builder.orchestrator.build_buildx_command()."""
+    result = orchestrator.build_buildx_command(
+        _build_info("21.0", "512"),
+        "name/repo",
+        pathlib.Path("/dockerfiles"),
+        push=push,
+        alias=alias,
+        metadata_file=metadata_file,
+    )
+
+    assert result == [
+        "docker",
+        "buildx",
+        "build",
+        "--build-arg",
+        "HOUDINI_VERSION=21.0.512",
+        "--build-arg",
+        "HOUDINI_INSTALLER_FILENAME=install_houdini_launcher_21.0.512.sh",
+        "--build-arg",
+        "HOUDINI_ISO_FILENAME=houdini-21.0.512-linux_x86_64_gcc11.2.iso",
+        "--tag",
+        "name/repo:21.0.512",
+        *expected,
+        "/dockerfiles/21.0",
+    ]
+
+
+@pytest.mark.parametrize("fail", ("", "22.0.123"))
+def test_run_builds(
+    mocker: MockerFixture,
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: pathlib.Path,
+    fake_docker: pathlib.Path,
+    fail: str,
+) -> None:
+    """Test hython_docker_image_builder.orchestrator.run_builds()."""
+    monkeypatch.setenv("FAKE_DOCKER_FAIL", fail)
+    mock_usage = mocker.patch("shutil.disk_usage", return_value=_DiskUsage(0, 0, 100))
+
+    builds = [
+        _build_info("20.5", "100"),
+        {},
+        _build_info("21.0", "512"),
+        _build_info("21.0", "500"),
+        _build_info("22.0", "123"),
+    ]
+    log_dir = tmp_path / "logs"
+
+    context = pytest.raises(RuntimeError, match=r"22\.0\.123") if fail else nullcontext()
+
+    start = time.perf_counter()
+
+    with context:
+        results = orchestrator.run_builds(
+            builds,
+            "name/repo",
+            log_dir,
+            dockerfiles_dir=tmp_path,
+            max_jobs=3,
+            disk_per_build=50,
+            docker_executable=fake_docker.as_posix(),
+        )
+
+        assert [(result["version"], result["returncode"]) for result in results] == [
+            ("20.5", 0),
+            ("21.0", 0),
+            ("21.0", 0),
+            ("22.0", 0),
+        ]
+
+        log_text = results[1]["log_path"].read_text(encoding="utf-8")
+
+        assert "[21.0.512] buildx build --build-arg HOUDINI_VERSION=21.0.512" in log_text
+        assert log_text.splitlines()[-1].endswith("[21.0.512] built 21.0.512")
+
+        # Only the newest build of a major.minor moves its alias.
+        assert "--tag name/repo:21.0 " in log_text
+        assert "--tag name/repo:21.0 " not in results[2]["log_path"].read_text(encoding="utf-8")
+
+    # Three job slots are available, but the disk space only allows for two builds at once.
+    assert _get_max_concurrency(tmp_path / "events.txt") == 2
+    assert time.perf_counter() - start < 4 * 0.2 + 1
+
+    mock_usage.assert_called_with(tmp_path)
+
+
+@pytest.mark.parametrize("push", (False, True))
+def test_run_builds__history(
+    mocker: MockerFixture,
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: pathlib.Path,
+    fake_docker: pathlib.Path,
+    push: bool,
+) -> None:
+    """Test hython_docker_image_builder.orchestrator.run_builds() recording successful builds to a build history."""
+    monkeypatch.setenv("FAKE_DOCKER_FAIL", "22.0.123")
+    mocker.patch("shutil.disk_usage", return_value=_DiskUsage(0, 0, 100))
+
+    build_history = history.BuildHistory(tmp_path / "history.sqlite")
+
+    try:
+        with pytest.raises(RuntimeError, match=r"22\.0\.123"):
+            orchestrator.run_builds(
+                [_build_info("21.0", "512"), _build_info("22.0", "123")],
+                "name/repo",
+                tmp_path / "logs",
+                dockerfiles_dir=tmp_path,
+                disk_per_build=50,
+                push=push,
+                docker_executable=fake_docker.as_posix(),
+                build_history=build_history,
+            )
+
+        events = build_history.get_events()
+
+    finally:
+        build_history.close()
+
+    assert [(event["stage"], event["version"], event["digest"]) for event in events] == [
+        (history.BUILT, "21.0.512", "sha256:21.0.512"),
+        *([(history.PUSHED, "21.0.512", "sha256:21.0.512")] if push else []),
+    ]
+
+    # Only the build itself is timed, since pushing is part of it.
+    assert events[0]["duration"] >= 0.2
+
+    if push:
+        assert events[1]["duration"] is None
+
+
+def test_run_builds__no_builds(tmp_path: pathlib.Path) -> None:
+    """Test hython_docker_image_builder.orchestrator.run_builds() when all builds were skipped."""
+    assert orchestrator.run_builds([{}, {}], "name/repo", tmp_path) == []
+
+
+def test_run_builds__no_disk_space(mocker: MockerFixture, tmp_path: pathlib.Path) -> None:
+    """Test hython_docker_image_builder.orchestrator.run_builds() when there is not enough free disk space."""
+    mocker.patch("shutil.disk_usage", return_value=_DiskUsage(0, 0, 10))
+    mocker.patch("pathlib.Path.cwd", return_value=tmp_path)
+
+    with pytest.raises(RuntimeError, match="Not enough free disk space"):
+        orchestrator.run_builds([_build_info("21.0", "512")], "name/repo", tmp_path, disk_path=pathlib.Path("/"))
@@ -0,0 +1,170 @@
+"""Test the hython_docker_image_builder.profiling module."""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import json
+import pathlib
+import pstats
+import tracemalloc
+from typing import TYPE_CHECKING
+
+# Third Party
+import pytest
+
+# hython_docker_image_builder
+from hython_docker_image_builder import profiling
+
+if TYPE_CHECKING:
+    from pytest_mock import MockerFixture
+
+
+def _allocate_inner() -> None:
+    """Temporarily allocate 4MiB."""
+    data = bytearray(4 * 1024**2)
+    del data
+
+
+def _allocate_outer() -> bytearray:
+    """Allocate 1MiB to keep."""
+    return bytearray(1024**2)
+
+
+# Tests
+
+
+class TestProfiler:
+    """Test hython_docker_image_builder.profiling.Profiler."""
+
+    def test_stage(self, tmp_path: pathlib.Path) -> None:
+        """Test hython_docker_image_builder.profiling.Profiler.stage()."""
+        profiler = profiling.Profiler(tmp_path, top_allocations=3)
+
+        with profiler.stage("outer"):
+            kept = _allocate_outer()
+
+            with profiler.stage("inner / nested"):
+                _allocate_inner()
+
+        profiler.stop()
+
+        assert not tracemalloc.is_tracing()
+
+        outer, inner = profiler.stages
+
+        assert inner["name"] == "inner / nested"
+        assert inner["stats_path"] == (tmp_path / "02_inner_nested.prof").as_posix()
+        assert 4 * 1024**2 <= inner["peak_increase_bytes"] < 5 * 1024**2
+
+        # The outer stage's peak includes the nested stage, and the memory it kept.
+        assert outer["peak_increase_bytes"] >= 5 * 1024**2
+        assert outer["peak_bytes"] - outer["start_bytes"] == outer["peak_increase_bytes"]
+        assert outer["duration"] >= inner["duration"]
+
+        assert len(outer["top_allocations"]) <= 3
+        assert outer["top_allocations"][0]["location"].startswith(__file__)
+        assert outer["top_allocations"][0]["size_diff"] >= len(kept)
+
+        # The outer stage's call statistics exclude the nested stage.
+        outer_functions = {function for _, _, function in pstats.Stats(outer["stats_path"]).stats}
+        inner_functions = {function for _, _, function in pstats.Stats(inner["stats_path"]).stats}
+
+        assert "_allocate_outer" in outer_functions
+        assert "_allocate_inner" not in outer_functions
+        assert "_allocate_inner" in inner_functions
+
+    def test_start(self, tmp_path: pathlib.Path) -> None:
+        """Test that memory tracing which was already running is left running."""
+        tracemalloc.start()
+
+        try:
+            profiler = profiling.Profiler(tmp_path)
+
+            with profiler.stage("stage"):
+                pass
+
+            profiler.stop()
+
+            assert tracemalloc.is_tracing()
+
+        finally:
+            tracemalloc.stop()
+
+    def test_write_summary(self, tmp_path: pathlib.Path, capsys: pytest.CaptureFixture) -> None:
+        """Test hython_docker_image_builder.profiling.Profiler.write_summary()."""
+        profiler = profiling.Profiler(tmp_path)
+        profiler.stages = [
+            {"name": "auth", "duration": 1.5, "start_bytes": 1024**2, "peak_increase_bytes": 2 * 1024**2}
+        ]
+
+        result = profiler.write_summary()
+
+        assert result == tmp_path / profiling.SUMMARY_FILE_NAME
+        assert json.loads(result.read_text(encoding="utf-8")) == profiler.stages
+        assert "auth: 1.500s, peak 2.00 MiB above 1.00 MiB" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("github_output", (None, "/runner/_temp/set_output"))
+def test_get_default_output_dir(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch, github_output: str | None
+) -> None:
+    """Test hython_docker_image_builder.profiling.get_default_output_dir()."""
+    mocker.patch("pathlib.Path.cwd", return_value=pathlib.Path("/cwd"))
+
+    if github_output is None:
+        monkeypatch.delenv("GITHUB_OUTPUT", raising=False)
+
+    else:
+        monkeypatch.setenv("GITHUB_OUTPUT", github_output)
+
+    expected = pathlib.Path("/runner/_temp" if github_output else "/cwd") / profiling.PROFILE_DIR_NAME
+
+    assert profiling.get_default_output_dir() == expected
+
+
+@pytest.mark.parametrize("value,expected", ((None, False), ("0", False), ("1", True), ("True", True)))
+def test_is_enabled_by_env(monkeypatch: pytest.MonkeyPatch, value: str | None, expected: bool) -> None:
+    """Test hython_docker_image_builder.profiling.is_enabled_by_env()."""
+    if value is None:
+        monkeypatch.delenv(profiling.PROFILE_ENV_VAR, raising=False)
+
+    else:
+        monkeypatch.setenv(profiling.PROFILE_ENV_VAR, value)
+
+    assert profiling.is_enabled_by_env() == expected
+
+
+def test_profile(tmp_path: pathlib.Path) -> None:
+    """Test hython_docker_image_builder.profiling.profile() and hython_docker_image_builder.profiling.stage()."""
+    output_dir = tmp_path / "profile"
+
+    # Stages are not recorded unless profiling is enabled.
+    with profiling.stage("ignored"):
+        pass
+
+    with profiling.profile(output_dir) as profiler, profiling.stage("listing"):
+        _allocate_outer()
+
+    assert [record["name"] for record in profiler.stages] == ["listing"]
+    assert not tracemalloc.is_tracing()
+
+    summary = json.loads((output_dir / profiling.SUMMARY_FILE_NAME).read_text(encoding="utf-8"))
+
+    assert summary[0]["name"] == "listing"
+    assert pathlib.Path(summary[0]["stats_path"]).is_file()
+
+    with profiling.stage("ignored"):
+        pass
+
+    assert len(profiler.stages) == 1
+
+
+def test_profile__default_output_dir(mocker: MockerFixture, tmp_path: pathlib.Path) -> None:
+    """Test hython_docker_image_builder.profiling.profile() writing to the default directory."""
+    mocker.patch("hython_docker_image_builder.profiling.get_default_output_dir", return_value=tmp_path / "default")
+
+    with profiling.profile():
+        pass
+
+    assert (tmp_path / "default" / profiling.SUMMARY_FILE_NAME).is_file()
@@ -0,0 +1,491 @@
+"""Test the additions made to the sidefx module."""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import asyncio
+import builtins
+import email.utils
+import gzip
+import hashlib
+import http
+import json
+import threading
+import time
+import tracemalloc
+from typing import TYPE_CHECKING
+
+# Third Party
+import pytest
+import urllib3
+
+# hython_docker_image_builder
+import sidefx
+
+if TYPE_CHECKING:
+    import pathlib
+    from collections.abc import Callable, Generator
+
+    from pytest_mock import MockerFixture
+
+
+class _FakeClock:
+    """A manually advanced monotonic clock."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _encode_with_urllib3(boundary: str, json_value: str, uploads: list[tuple[str, str, bytes]]) -> bytes:
+    """Encode a multipart body the way requests would have."""
+    fields: list = [("json", json_value.encode())]
+    fields.extend((name, (filename, data, "application/octet-stream")) for name, filename, data in uploads)
+
+    return urllib3.encode_multipart_formdata(fields, boundary=boundary)[0]
+
+
+def _get_response_file(
+    stub_server: Callable, content: bytes, *, encoding: str | None, chunked: bool, truncate_at: int | None = None
+) -> sidefx.ResponseFile:
+    """Call a stand-in API function which streams binary content, optionally cut short."""
+    stub = stub_server({
+        "body": gzip.compress(content) if encoding == "gzip" else content,
+        "headers": {"Content-Encoding": encoding} if encoding is not None else None,
+        "chunked": chunked,
+        "write_size": 100000,
+        "truncate_at": truncate_at,
+    })
+
+    return sidefx.call_api_with_access_token(stub.url, "token", "a.b", [], {}, rate_limiter=sidefx.RateLimiter())
+
+
+# Tests
+
+
+class TestJSONArrayReader:
+    """Test sidefx._JSONArrayReader."""
+
+    @pytest.mark.parametrize("chunk_size", (1, 2, 7, 1000000))
+    def test_items(self, chunk_size: int) -> None:
+        """Test that items are parsed no matter where the chunks are split."""
+        value = [{"build": str(index), "name": "é" * index} for index in range(20)]
+        value.extend((1234567, 1.5e10, "text", [1, [2]], None, True, 12))
+
+        data = json.dumps(value, indent=2).encode()
+        chunks = (data[start : start + chunk_size] for start in range(0, len(data), chunk_size))
+
+        assert list(sidefx._JSONArrayReader(chunks)) == value
+
+    def test_items__lazy(self) -> None:
+        """Test that items are produced before all the input has been read."""
+        read = []
+
+        def chunks() -> Generator[bytes]:
+            for chunk in (b'[{"a": 1},', b' {"b": 2}', b"]"):
+                read.append(chunk)
+                yield chunk
+
+        iterator = iter(sidefx._JSONArrayReader(chunks()))
+
+        assert next(iterator) == {"a": 1}
+        assert len(read) == 1
+
+    @pytest.mark.parametrize("data", (b" [ ] ", b"[]"))
+    def test_items__empty(self, data: bytes) -> None:
+        """Test parsing an empty array."""
+        assert not list(sidefx._JSONArrayReader([data]))
+
+    @pytest.mark.parametrize("data", (b"", b"{}", b"[1,", b"[1 2]", b"[1.]", b'[{"a": }]'))
+    def test_items__invalid(self, data: bytes) -> None:
+        """Test that invalid or truncated input raises an error."""
+        chunks = [data[index : index + 1] for index in range(len(data))]
+
+        with pytest.raises(ValueError):  # ruff:ignore[pytest-raises-too-broad]
+            list(sidefx._JSONArrayReader(chunks))
+
+
+class TestMultipartEncoder:
+    """Test sidefx._MultipartEncoder."""
+
+    def test_body(self, tmp_path: pathlib.Path) -> None:
+        """Test that the streamed body matches what requests would have sent."""
+        file_path = tmp_path / 'upload "file".bin'
+        file_path.write_bytes(b"file contents" * 10000)
+        blob = bytearray(b"blob contents" * 10000)
+
+        encoder = sidefx._MultipartEncoder(
+            [("json", '["a.b", [], {}]')],
+            [("upload", file_path.as_posix(), sidefx.File(file_path.as_posix())), ("blob", "unnamed.bin", blob)],
+            chunk_size=1000,
+        )
+
+        chunks = list(encoder)
+        body = b"".join(bytes(chunk) for chunk in chunks)
+
+        assert body == _encode_with_urllib3(
+            encoder.boundary,
+            '["a.b", [], {}]',
+            [("upload", file_path.as_posix(), file_path.read_bytes()), ("blob", "unnamed.bin", bytes(blob))],
+        )
+        assert len(encoder) == len(body)
+        assert encoder.content_type == f"multipart/form-data; boundary={encoder.boundary}"
+
+        # Contents are sent in chunks and the bytearray isn't copied.
+        assert max(len(chunk) for chunk in chunks) == 1000
+        assert any(isinstance(chunk, memoryview) and chunk.obj is blob for chunk in chunks)
+
+        # The body can be produced again for a retry.
+        assert b"".join(bytes(chunk) for chunk in encoder) == body
+
+    def test_progress(self, mocker: MockerFixture) -> None:
+        """Test that upload progress is reported as the body is produced."""
+        mock_progress = mocker.MagicMock()
+
+        encoder = sidefx._MultipartEncoder(
+            [("json", "[]")], [("blob", "unnamed.bin", bytearray(2500))], chunk_size=1000, progress=mock_progress
+        )
+
+        list(encoder)
+
+        sent = [call.args[0] for call in mock_progress.call_args_list]
+
+        assert sent == sorted(sent)
+        assert sent[-1] == len(encoder)
+        assert {call.args[1] for call in mock_progress.call_args_list} == {len(encoder)}
+
+    def test_close(self, mocker: MockerFixture, tmp_path: pathlib.Path) -> None:
+        """Test that files are closed when a body is only partially sent."""
+        file_path = tmp_path / "upload.bin"
+        file_path.write_bytes(bytes(10000))
+
+        spy_open = mocker.spy(builtins, "open")
+
+        with sidefx._MultipartEncoder(
+            [], [("upload", "upload.bin", sidefx.File(file_path.as_posix()))], chunk_size=1000
+        ) as encoder:
+            iterator = iter(encoder)
+
+            # Read the part header and then the first chunk of the file.
+            next(iterator)
+            next(iterator)
+
+            assert not spy_open.spy_return.closed
+
+        assert spy_open.spy_return.closed
+
+    def test_memory(self, tmp_path: pathlib.Path) -> None:
+        """Test that peak memory use is bounded by the chunk size and not the upload size."""
+        file_path = tmp_path / "upload.bin"
+
+        with file_path.open("wb") as handle:
+            handle.truncate(32 * 1024 * 1024)
+
+        blob = bytearray(32 * 1024 * 1024)
+
+        encoder = sidefx._MultipartEncoder(
+            [("json", "[]")],
+            [("upload", "upload.bin", sidefx.File(file_path.as_posix())), ("blob", "unnamed.bin", blob)],
+        )
+
+        tracemalloc.start()
+
+        try:
+            total = sum(len(chunk) for chunk in encoder)
+            _, peak = tracemalloc.get_traced_memory()
+
+        finally:
+            tracemalloc.stop()
+
+        assert total == len(encoder) > 64 * 1024 * 1024
+        assert peak < 4 * sidefx.UPLOAD_CHUNK_SIZE
+
+
+@pytest.mark.parametrize("encoding,chunked", ((None, False), (None, True), ("identity", False), ("gzip", False)))
+class TestResponseFile:
+    """Test sidefx.ResponseFile."""
+
+    content = bytes(range(256)) * 4096
+
+    def test_iter_chunks(self, stub_server: Callable, encoding: str | None, chunked: bool) -> None:
+        """Test sidefx.ResponseFile.iter_chunks()."""
+        with _get_response_file(stub_server, self.content, encoding=encoding, chunked=chunked) as response_file:
+            buffers = set()
+            result = bytearray()
+
+            for chunk in response_file.iter_chunks(65536):
+                assert len(chunk) <= 65536
+
+                buffers.add(id(chunk.obj))
+                result += chunk
+
+        assert result == self.content
+
+        # Every chunk should be a view of the same reused buffer.
+        assert len(buffers) == 1
+
+        assert response_file.response.raw.closed
+
+    def test_read(self, stub_server: Callable, encoding: str | None, chunked: bool) -> None:
+        """Test sidefx.ResponseFile.read() and sidefx.ResponseFile.readinto()."""
+        buffer = bytearray(1000)
+
+        with _get_response_file(stub_server, self.content, encoding=encoding, chunked=chunked) as response_file:
+            start = response_file.read(10)
+            num_bytes = response_file.readinto(buffer)
+            rest = response_file.read()
+
+        assert start + buffer[:num_bytes] + rest == self.content
+
+    @pytest.mark.parametrize("hash_name", (None, "md5"))
+    def test_copy_to(
+        self,
+        stub_server: Callable,
+        tmp_path: pathlib.Path,
+        encoding: str | None,
+        chunked: bool,
+        hash_name: str | None,
+    ) -> None:
+        """Test sidefx.ResponseFile.copy_to()."""
+        target = tmp_path / "download.bin"
+
+        with _get_response_file(stub_server, self.content, encoding=encoding, chunked=chunked) as response_file:
+            result = response_file.copy_to(target.as_posix(), hash_name=hash_name, chunk_size=65536)
+
+        assert target.read_bytes() == self.content
+        assert result == (hashlib.md5(self.content).hexdigest() if hash_name else None)
+
+    @pytest.mark.parametrize(
+        "consume",
+        (
+            lambda response_file, target: response_file.copy_to(target.as_posix(), chunk_size=65536),
+            lambda response_file, _target: list(response_file.iter_chunks(65536)),
+            lambda response_file, _target: list(iter(lambda: response_file.read(65536), b"")),
+            lambda response_file, _target: response_file.read(),
+        ),
+        ids=("copy_to", "iter_chunks", "read", "read_all"),
+    )
+    def test_truncated(
+        self,
+        stub_server: Callable,
+        tmp_path: pathlib.Path,
+        encoding: str | None,
+        chunked: bool,
+        consume: Callable,
+    ) -> None:
+        """Test that content which ends early is an error rather than silently incomplete."""
+        with (
+            _get_response_file(
+                stub_server, self.content, encoding=encoding, chunked=chunked, truncate_at=2000
+            ) as response_file,
+            pytest.raises(urllib3.exceptions.ProtocolError),
+        ):
+            consume(response_file, tmp_path / "download.bin")
+
+
+class TestRateLimiter:
+    """Test sidefx.RateLimiter."""
+
+    def test_reserve(self) -> None:
+        """Test sidefx.RateLimiter.reserve()."""
+        clock = _FakeClock()
+        limiter = sidefx.RateLimiter(rate=2, burst=2, clock=clock)
+
+        # The initial burst is available immediately, after which calls are paced.
+        assert [limiter.reserve() for _ in range(4)] == [0, 0, 0.5, 1.0]
+
+        # The bucket refills over time but never beyond the burst size.
+        clock.now = 10
+        assert [limiter.reserve() for _ in range(3)] == [0, 0, 0.5]
+
+    def test_acquire(self, mocker: MockerFixture) -> None:
+        """Test sidefx.RateLimiter.acquire()."""
+        mock_sleep = mocker.patch("sidefx.time.sleep")
+        limiter = sidefx.RateLimiter(rate=4, burst=1, clock=_FakeClock())
+
+        assert limiter.acquire() == 0
+        mock_sleep.assert_not_called()
+
+        assert limiter.acquire() == pytest.approx(0.25)
+        mock_sleep.assert_called_once_with(0.25)
+
+    def test_record_throttle(self) -> None:
+        """Test sidefx.RateLimiter.record_throttle()."""
+        clock = _FakeClock()
+        limiter = sidefx.RateLimiter(rate=2, burst=2, min_rate=0.75, clock=clock)
+
+        limiter.record_throttle(5)
+
+        # The rate is halved, the bucket emptied and calls are held until the Retry-After has passed.
+        assert limiter.rate == 1
+        assert limiter.reserve() == 6
+
+        clock.now = 6
+        limiter.record_throttle()
+
+        assert limiter.rate == pytest.approx(0.75)
+        assert limiter.reserve() == pytest.approx(1 / 0.75)
+
+    def test_record_success(self) -> None:
+        """Test sidefx.RateLimiter.record_success()."""
+        limiter = sidefx.RateLimiter(rate=2, recovery=0.5, clock=_FakeClock())
+
+        limiter.record_throttle()
+        assert limiter.rate == 1
+
+        limiter.record_success()
+        assert limiter.rate == pytest.approx(1.5)
+
+        limiter.record_success()
+        limiter.record_success()
+        assert limiter.rate == 2
+
+    def test_threads(self) -> None:
+        """Test that sidefx.RateLimiter hands out each token exactly once across threads."""
+        limiter = sidefx.RateLimiter(rate=10, burst=10, clock=_FakeClock())
+        delays = []
+
+        def reserve_many() -> None:
+            delays.extend(limiter.reserve() for _ in range(100))
+
+        threads = [threading.Thread(target=reserve_many) for _ in range(8)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert sorted(delays) == [max(index - 9, 0) / 10 for index in range(800)]
+
+    def test_asyncio(self) -> None:
+        """Test that sidefx.RateLimiter can pace asyncio tasks."""
+        limiter = sidefx.RateLimiter(rate=1000, burst=1)
+        delays = []
+
+        async def call() -> None:
+            delay = limiter.reserve()
+            delays.append(delay)
+            await asyncio.sleep(delay)
+
+        async def run() -> None:
+            await asyncio.gather(*(call() for _ in range(5)))
+
+        asyncio.run(run())
+
+        assert delays[0] == 0
+        assert delays == sorted(delays)
+        assert delays[-1] == pytest.approx(0.004, abs=0.001)
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    (
+        (None, None),
+        ("", None),
+        ("3", 3),
+        ("1.5", 1.5),
+        ("-1", 0),
+        ("soon", None),
+        (email.utils.formatdate(1030, usegmt=True), 30),
+        (email.utils.formatdate(900, usegmt=True), 0),
+    ),
+)
+def test_parse_retry_after(value: str | None, expected: float | None) -> None:
+    """Test sidefx.parse_retry_after()."""
+    assert sidefx.parse_retry_after(value, now=1000) == expected
+
+
+@pytest.mark.parametrize("throttled_count,succeeds", ((1, True), (2, False)))
+def test_call_api_with_access_token__rate_limited(
+    mocker: MockerFixture, stub_server: Callable, throttled_count: int, succeeds: bool
+) -> None:
+    """Test sidefx.call_api_with_access_token() when the server responds with 429."""
+    mock_sleep = mocker.patch("sidefx.time.sleep")
+
+    throttled = {"status": http.HTTPStatus.TOO_MANY_REQUESTS, "body": {"result": True}, "headers": {"Retry-After": "2"}}
+    url = stub_server(*[throttled] * throttled_count, {"body": {"result": True}}).url
+    limiter = sidefx.RateLimiter(rate=4, burst=4, recovery=1)
+
+    if succeeds:
+        result = sidefx.call_api_with_access_token(url, "token", "a.b", [], {}, rate_limiter=limiter, max_attempts=2)
+
+        assert result == {"result": True}
+        assert limiter.rate == 3
+
+        # The retry should have waited for the Retry-After period.
+        assert mock_sleep.call_args.args[0] == pytest.approx(2 + 1 / 2, abs=0.1)
+
+    else:
+        with pytest.raises(sidefx.APIError) as exc_info:
+            sidefx.call_api_with_access_token(url, "token", "a.b", [], {}, rate_limiter=limiter, max_attempts=2)
+
+        assert exc_info.value.http_code == http.HTTPStatus.TOO_MANY_REQUESTS
+        assert limiter.rate == 1
+
+
+def test_call_api_with_access_token__uploads(
+    mocker: MockerFixture, stub_server: Callable, tmp_path: pathlib.Path
+) -> None:
+    """Test sidefx.call_api_with_access_token() streaming uploads, including when retrying."""
+    mocker.patch("sidefx.time.sleep")
+
+    stub = stub_server({"status": http.HTTPStatus.TOO_MANY_REQUESTS, "body": []}, {"body": []})
+
+    file_path = tmp_path / "upload.bin"
+    file_path.write_bytes(b"file contents" * 100000)
+
+    kwargs = {"name": "value", "upload": sidefx.File(file_path.as_posix()), "blob": bytearray(b"blob")}
+
+    result = sidefx.call_api_with_access_token(
+        stub.url, "token", "a.b", [], kwargs, rate_limiter=sidefx.RateLimiter(), max_attempts=2
+    )
+
+    assert result == []
+    assert len(stub.requests) == 2
+
+    (_, _, first_headers, first_body, _), (_, _, headers, body, _) = stub.requests
+
+    assert "Transfer-Encoding" not in headers
+
+    boundary = headers["Content-Type"].split("boundary=")[1]
+
+    assert body == _encode_with_urllib3(
+        boundary,
+        json.dumps(["a.b", [], {"name": "value"}]),
+        [("upload", file_path.as_posix(), file_path.read_bytes()), ("blob", "unnamed.bin", b"blob")],
+    )
+
+    # The retried request should have sent the whole body again.
+    assert first_headers["Content-Type"] == headers["Content-Type"]
+    assert first_body == body
+
+
+def test__api_function_iter_items(stub_server: Callable) -> None:
+    """Test sidefx._APIFunction.iter_items()."""
+    releases = [{"build": str(build), "version": "21.0"} for build in range(1000)]
+
+    stub = stub_server({"body": releases, "chunked": True, "write_size": 64})
+    service = sidefx._Service(stub.url, "token", time.time() + 100, None, rate_limiter=sidefx.RateLimiter())
+
+    items = service.download.get_daily_builds_list.iter_items(product="houdini", only_production=True)
+
+    assert list(items) == releases
+
+    items = service.download.get_daily_builds_list.iter_items(product="houdini", only_production=True)
+
+    # Closing the generator early should close the response.
+    assert next(items) == releases[0]
+
+    items.close()
+
+    assert stub.requests[-1].get_api_call() == [
+        "download.get_daily_builds_list",
+        [],
+        {"product": "houdini", "only_production": True},
+    ]
+
+    service.close()
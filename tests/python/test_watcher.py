@@ -0,0 +1,182 @@
+"""Test the hython_docker_image_builder.watcher module."""
+
+# Future
+from __future__ import annotations
+
+# Standard Library
+import http
+import time
+from typing import TYPE_CHECKING
+
+# Third Party
+import pytest
+import requests
+
+# hython_docker_image_builder
+import sidefx
+from hython_docker_image_builder import watcher
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from pytest_mock import MockerFixture
+
+
+# Tests
+
+
+def test__apply_jitter() -> None:
+    """Test hython_docker_image_builder.watcher._apply_jitter()."""
+    assert watcher._apply_jitter(100, 0) == 100
+
+    for _ in range(100):
+        assert 90 <= watcher._apply_jitter(100, 0.1) <= 110
+
+
+def test__build_release_key() -> None:
+    """Test hython_docker_image_builder.watcher._build_release_key()."""
+    assert watcher._build_release_key({"version": "21.0", "build": "512"}) == "21.0.512"
+
+
+def test__find_new_releases() -> None:
+    """Test hython_docker_image_builder.watcher._find_new_releases()."""
+    releases = [
+        {"build": "789", "date": "2024/10/27", "version": "21.0"},
+        {"build": "456", "date": "2024/10/26", "version": "21.0"},
+        {"build": "123", "date": "2024/10/25", "version": "21.0"},
+    ]
+
+    result = watcher._find_new_releases({"21.0.123"}, releases)
+
+    assert result == [releases[1], releases[0]]
+
+
+@pytest.mark.parametrize(
+    "known,expected",
+    (
+        (None, {"21.0.123", "21.0.456", "21.0.789"}),
+        ({"21.0.456"}, {"21.0.123", "21.0.456"}),
+        ({"21.0.123", "21.0.789"}, {"21.0.123", "21.0.456", "21.0.789"}),
+        (set(), {"21.0.123", "21.0.456"}),
+    ),
+)
+def test__get_initial_seen(known: set[str] | None, expected: set[str]) -> None:
+    """Test hython_docker_image_builder.watcher._get_initial_seen()."""
+    releases = [
+        {"build": "456", "date": "2024/10/26", "version": "21.0"},
+        {"build": "789", "date": "2024/10/27", "version": "21.0"},
+        {"build": "123", "date": "2024/10/25", "version": "21.0"},
+    ]
+
+    is_known = (lambda release: watcher._build_release_key(release) in known) if known is not None else None
+
+    assert watcher._get_initial_seen(releases, is_known) == expected
+
+
+@pytest.mark.parametrize(
+    "interval,found_new,expected",
+    (
+        (10, True, 10),
+        (80, True, 10),
+        (10, False, 20),
+        (80, False, 100),
+    ),
+)
+def test__get_next_interval(interval: float, found_new: bool, expected: float) -> None:
+    """Test hython_docker_image_builder.watcher._get_next_interval()."""
+    assert watcher._get_next_interval(interval, 10, 100, found_new=found_new) == expected
+
+
+def test__list_releases(mocker: MockerFixture) -> None:
+    """Test hython_docker_image_builder.watcher._list_releases()."""
+    mock_service = mocker.MagicMock()
+
+    result = watcher._list_releases(mock_service, "21.0")
+
+    assert result == mock_service.download.get_daily_builds_list.return_value
+
+    mock_service.download.get_daily_builds_list.assert_called_with(
+        product="houdini", version="21.0", platform="linux", only_production=True
+    )
+
+
+def test_watch_releases(mocker: MockerFixture, stub_server: Callable) -> None:
+    """Test hython_docker_image_builder.watcher.watch_releases()."""
+    existing = {"build": "456", "date": "2024/10/26", "version": "21.0"}
+    new = {"build": "512", "date": "2024/10/28", "version": "21.0"}
+
+    stub = stub_server(
+        {"body": [existing]},
+        {"status": http.HTTPStatus.INTERNAL_SERVER_ERROR, "body": "Server error"},
+        {"body": [existing]},
+        {"body": [existing, new]},
+    )
+    url = stub.url
+
+    # The first service expires after the first poll, and replacing it fails once.
+    mock_get_service = mocker.MagicMock(
+        side_effect=(
+            sidefx._Service(url, "expired", 0, timeout=5),
+            sidefx.AuthorizationError(503, "Unavailable"),
+            sidefx._Service(url, "token", time.time() + 3600, timeout=5),
+        )
+    )
+    mock_sleep = mocker.patch("hython_docker_image_builder.watcher.time.sleep")
+
+    # A failing callable shouldn't stop the watch, and the release should be retried on the next poll.
+    mock_on_new = mocker.MagicMock(side_effect=(RuntimeError("Hook failed"), None))
+
+    watcher.watch_releases(mock_get_service, "21.0", mock_on_new, min_interval=10, jitter=0, max_polls=7)
+
+    assert mock_on_new.call_args_list == [mocker.call(new), mocker.call(new)]
+
+    assert mock_get_service.call_count == 3
+    assert [call.args[0] for call in mock_sleep.call_args_list] == [10, 20, 40, 80, 160, 10]
+
+    assert stub.requests[0].get_api_call() == [
+        "download.get_daily_builds_list",
+        [],
+        {"product": "houdini", "version": "21.0", "platform": "linux", "only_production": True},
+    ]
+
+    # All the polls after the service was replaced should have been made over a single pooled connection.
+    assert len({request.client_port for request in stub.requests[1:]}) == 1
+
+
+def test_watch_releases__is_known(mocker: MockerFixture) -> None:
+    """Test hython_docker_image_builder.watcher.watch_releases() reporting releases missed while not watching."""
+    built = {"build": "456", "date": "2024/10/26", "version": "21.0"}
+    missed = [
+        {"build": "512", "date": "2024/10/28", "version": "21.0"},
+        {"build": "500", "date": "2024/10/27", "version": "21.0"},
+    ]
+
+    mock_service = mocker.MagicMock(access_token_expiry_time=time.time() + 3600)
+    mocker.patch("hython_docker_image_builder.watcher._list_releases", return_value=[*missed, built])
+    mock_on_new = mocker.MagicMock()
+
+    watcher.watch_releases(
+        mocker.MagicMock(return_value=mock_service),
+        "21.0",
+        mock_on_new,
+        max_polls=1,
+        is_known=lambda release: release is built,
+    )
+
+    assert mock_on_new.call_args_list == [mocker.call(missed[1]), mocker.call(missed[0])]
+
+    mock_service.close.assert_called_once()
+
+
+def test_watch_releases__no_service(mocker: MockerFixture) -> None:
+    """Test hython_docker_image_builder.watcher.watch_releases() when a service can never be created."""
+    mock_get_service = mocker.MagicMock(side_effect=requests.ConnectionError("Unreachable"))
+    mock_sleep = mocker.patch("hython_docker_image_builder.watcher.time.sleep")
+    mock_on_new = mocker.MagicMock()
+
+    watcher.watch_releases(mock_get_service, "21.0", mock_on_new, min_interval=10, jitter=0, max_polls=3)
+
+    assert mock_get_service.call_count == 3
+    assert [call.args[0] for call in mock_sleep.call_args_list] == [20, 40]
+
+    mock_on_new.assert_not_called()
@@ -20,3 +20,9 @@ pip --version | grep "python${_CONTAINER_PYTHON_VERSION}"
 pip3 --version | grep "python${_CONTAINER_PYTHON_VERSION}"
 python -m pip --version | grep "python${_CONTAINER_PYTHON_VERSION}"
 python3 -m pip --version | grep "python${_CONTAINER_PYTHON_VERSION}"
+
+# Verify that hash based bytecode was precompiled for the installed rez packages and Houdini's Python libraries.  The
+# flags word in a .pyc header is 3 for checked-hash pycs and 1 for unchecked-hash ones.
+_PYC_NAME="*.cpython-${_CONTAINER_PYTHON_VERSION//./}.pyc"
+od -An -tu4 -j4 -N4 "$(find ${REZ_PACKAGES_PATH} -name "${_PYC_NAME}" -print -quit)" | grep -x " *3"
+od -An -tu4 -j4 -N4 "$(find ${HFS}/houdini/python${_CONTAINER_PYTHON_VERSION}libs -name "${_PYC_NAME}" -print -quit)" | grep -x " *1"